@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Dispatch cost per update: one CommandHandler per command (the old
+register_handlers layout) versus the routing table in utils/router.py.
+
+    python bench_dispatch.py [iterations]
+
+Both layouts use the real command and callback tables from main.py with
+no-op callbacks, and run the same handler groups, so the numbers isolate
+how long PTB takes to find the handler for an update. No network access.
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="churchbot-bench-"))
+
+from telegram import Update, User
+from telegram.ext import (
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    ChatMemberHandler,
+    CommandHandler,
+    MessageHandler,
+    filters,
+)
+
+import main
+from utils.router import CommandRouter
+
+BOT_USERNAME = "churchbot"
+
+
+async def noop(update, context):
+    return None
+
+
+def _build_app(layout: str):
+    app = ApplicationBuilder().token("123456:BENCHMARK").build()
+    # What initialize() would set up via getMe, without a network round trip.
+    app.bot._bot_user = User(id=123456, first_name="Church Bot", is_bot=True, username=BOT_USERNAME)
+    app._initialized = True
+    if layout == "before":
+        for name, _, _ in main.COMMANDS:
+            app.add_handler(CommandHandler(name, noop))
+        app.add_handler(CallbackQueryHandler(noop, pattern=r"^broadcast:"))
+        app.add_handler(CallbackQueryHandler(noop))
+    else:
+        router = CommandRouter()
+        for name, _, feature in main.COMMANDS:
+            router.add_command(name, noop, feature)
+        for namespace, _, feature in main.CALLBACKS:
+            router.add_callback(namespace, noop, feature)
+        app.add_handler(MessageHandler(filters.COMMAND & filters.UpdateType.MESSAGES, router.dispatch_command))
+        app.add_handler(CallbackQueryHandler(router.dispatch_callback))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, noop))
+    app.add_handler(MessageHandler(filters.StatusUpdate.MIGRATE, noop))
+    app.add_handler(ChatMemberHandler(noop, chat_member_types=ChatMemberHandler.MY_CHAT_MEMBER))
+    return app
+
+
+def _message(update_id: int, text: str) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": -100123, "type": "supergroup", "title": "Bench"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Member"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def _callback(update_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "bench",
+            "from": {"id": 42, "is_bot": False, "first_name": "Member"},
+            "data": data,
+        },
+    }
+
+
+SAMPLES = {
+    "first command (/start)": _message(1, "/start"),
+    "last command (/delgroup)": _message(2, "/delgroup -100123"),
+    f"addressed (/tran@{BOT_USERNAME})": _message(3, f"/tran@{BOT_USERNAME} hello my"),
+    "plain text": _message(4, "Amen!"),
+    "callback (quiz:A)": _callback(5, "quiz:A"),
+}
+
+
+async def _measure(app, payload: dict, iterations: int) -> float:
+    update = Update.de_json(payload, app.bot)
+    for _ in range(100):
+        await app.process_update(update)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app.process_update(update)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def run(iterations: int) -> None:
+    apps = {layout: _build_app(layout) for layout in ("before", "after")}
+    print(f"{len(main.COMMANDS)} commands, {iterations} updates per sample, µs per update")
+    print(f"{'update':<32}{'before':>10}{'after':>10}{'speedup':>10}")
+    for label, payload in SAMPLES.items():
+        before = await _measure(apps["before"], payload, iterations)
+        after = await _measure(apps["after"], payload, iterations)
+        print(f"{label:<32}{before:>10.1f}{after:>10.1f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -6,6 +6,22 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "your-telegram-bot-token-here")
 # --- Data Directory ---
 DATA_DIR = os.getenv("DATA_DIR", "data")
 
+# --- JSON Storage ---
+# Files are written compactly; set JSON_PRETTY=true for indented, hand-editable output.
+JSON_PRETTY = os.getenv("JSON_PRETTY", "false").lower() == "true"
+JSON_STREAM_THRESHOLD = int(os.getenv("JSON_STREAM_THRESHOLD", "1000"))
+
+# --- Data Tool (python datatool.py check|export|import|normalize) ---
+# Keys held in memory for duplicate detection before spilling to a temporary SQLite file.
+DATATOOL_MEMORY_KEYS = int(os.getenv("DATATOOL_MEMORY_KEYS", "500000"))
+
+# --- Snapshots ---
+# Incremental gzip snapshots of DATA_DIR; keep the newest N plus one per day for D days.
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "3600"))
+SNAPSHOT_KEEP_LAST = int(os.getenv("SNAPSHOT_KEEP_LAST", "24"))
+SNAPSHOT_KEEP_DAILY = int(os.getenv("SNAPSHOT_KEEP_DAILY", "14"))
+
 # --- Proxy Settings ---
 TELEGRAM_PROXY = os.getenv("TELEGRAM_PROXY") or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
 # config.py
@@ -19,8 +35,54 @@ TG_WRITE_TIMEOUT = int(os.getenv("TG_WRITE_TIMEOUT", "20"))
 TG_CONN_POOL = int(os.getenv("TG_CONN_POOL", "8"))
 
 # --- Retry Settings ---
+# Reconnects use jittered exponential backoff (base BOT_BACKOFF_SECONDS, capped at
+# BOT_BACKOFF_MAX_SECONDS per wait) with no attempt limit. BOT_START_RETRIES is no longer used.
 BOT_START_RETRIES = int(os.getenv("BOT_START_RETRIES", "6"))
 BOT_BACKOFF_SECONDS = int(os.getenv("BOT_BACKOFF_SECONDS", "5"))
+BOT_BACKOFF_MAX_SECONDS = int(os.getenv("BOT_BACKOFF_MAX_SECONDS", "300"))
+# How often the supervisor checks polling health, and how often it saves the last processed update_id.
+SUPERVISOR_CHECK_INTERVAL = float(os.getenv("SUPERVISOR_CHECK_INTERVAL", "5"))
+SUPERVISOR_STATE_SAVE_INTERVAL = float(os.getenv("SUPERVISOR_STATE_SAVE_INTERVAL", "10"))
+
+# --- Multi-instance Settings ---
+# Instances sharing DATA_DIR elect one scheduler leader; a dead leader's lease expires after this many seconds.
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+
+# --- Broadcast / Dead-chat Settings ---
+BROADCAST_RATE_PER_SEC = float(os.getenv("BROADCAST_RATE_PER_SEC", "25"))
+# Server-side assets for `/broadcast file <name>`; uploaded once, then sent by cached file_id.
+MEDIA_DIR = os.getenv("MEDIA_DIR", os.path.join(DATA_DIR, "media"))
+ALBUM_CACHE_SIZE = int(os.getenv("ALBUM_CACHE_SIZE", "50"))
+DEAD_CHAT_TRANSIENT_STRIKES = int(os.getenv("DEAD_CHAT_TRANSIENT_STRIKES", "5"))
+DEAD_CHAT_STALE_SECONDS = int(os.getenv("DEAD_CHAT_STALE_SECONDS", str(7 * 24 * 3600)))
+DEAD_CHAT_SWEEP_INTERVAL = int(os.getenv("DEAD_CHAT_SWEEP_INTERVAL", "3600"))
+DEAD_CHAT_SWEEP_BATCH = int(os.getenv("DEAD_CHAT_SWEEP_BATCH", "200"))
+DEAD_CHAT_SWEEP_RATE = float(os.getenv("DEAD_CHAT_SWEEP_RATE", "5"))
+
+# --- Multilingual Broadcasts ---
+# /broadcast_lang translates once per language in BROADCAST_LANGUAGES; recipients without
+# a /language preference get BROADCAST_DEFAULT_LANGUAGE (the first listed by default).
+BROADCAST_LANGUAGES = os.getenv("BROADCAST_LANGUAGES", "en,my")
+BROADCAST_DEFAULT_LANGUAGE = os.getenv("BROADCAST_DEFAULT_LANGUAGE", BROADCAST_LANGUAGES.split(",")[0])
+BROADCAST_DRAFT_TTL = int(os.getenv("BROADCAST_DRAFT_TTL", "3600"))
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2000"))
+
+# --- Flood Control ---
+# Token buckets per user and per chat; FLOOD_COMMAND_COSTS overrides per-command costs, e.g. "tran=5,myid=0.5".
+FLOOD_USER_CAPACITY = float(os.getenv("FLOOD_USER_CAPACITY", "20"))
+FLOOD_USER_REFILL = float(os.getenv("FLOOD_USER_REFILL", "0.5"))
+FLOOD_CHAT_CAPACITY = float(os.getenv("FLOOD_CHAT_CAPACITY", "60"))
+FLOOD_CHAT_REFILL = float(os.getenv("FLOOD_CHAT_REFILL", "2"))
+FLOOD_COMMAND_COSTS = os.getenv("FLOOD_COMMAND_COSTS", "")
+FLOOD_MAX_KEYS = int(os.getenv("FLOOD_MAX_KEYS", "10000"))
+FLOOD_DEDUP_WINDOW = int(os.getenv("FLOOD_DEDUP_WINDOW", "2048"))
+
+# --- Analytics ---
+# HyperLogLog distinct counters per day; memory is fixed by precision, retention and group cap.
+ANALYTICS_HLL_PRECISION = int(os.getenv("ANALYTICS_HLL_PRECISION", "10"))
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "30"))
+ANALYTICS_MAX_GROUPS = int(os.getenv("ANALYTICS_MAX_GROUPS", "500"))
+ANALYTICS_FLUSH_INTERVAL = int(os.getenv("ANALYTICS_FLUSH_INTERVAL", "300"))
 
 # --- Logging Settings ---
 LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
@@ -34,6 +96,12 @@ ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
 # --- Database Settings ---
 DB_URL = os.getenv("DB_URL", "sqlite:///data/churchbot.db")
 
+# --- Session Persistence (user_data/chat_data in DB_URL) ---
+QUIZ_SESSION_TTL = int(os.getenv("QUIZ_SESSION_TTL", str(24 * 3600)))
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "60"))
+PERSISTENCE_WRITE_DELAY = float(os.getenv("PERSISTENCE_WRITE_DELAY", "1.0"))
+PERSISTENCE_CACHE_SIZE = int(os.getenv("PERSISTENCE_CACHE_SIZE", "10000"))
+
 # --- Sentry Monitoring ---
 SENTRY_DSN = os.getenv("SENTRY_DSN", "")
 
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Import, export and check the bot's JSON datasets without loading them into memory.
+
+    python datatool.py check [dataset ...]
+    python datatool.py export [--format jsonl|csv] [--out DIR] [dataset ...]
+    python datatool.py import [--format jsonl|csv] [--replace] [--dry-run] <dataset> <file|->
+    python datatool.py normalize [dataset ...]
+
+Datasets: admins, groups, users, events, prayers, quizzes, quiz_questions
+(default: all that exist). IDs are normalized to strings and duplicates
+are dropped on import and normalize. Run it with the same DATA_DIR as the
+bot; writes are safe while the bot is running.
+"""
+import os
+import sys
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils import data_io
+
+logging.basicConfig(format="%(levelname)s | %(message)s", level=logging.WARNING)
+
+
+def _datasets(names, data_dir):
+    if names:
+        return [data_io.get_dataset(name) for name in names]
+    return [d for d in data_io.DATASETS.values() if os.path.exists(os.path.join(data_dir, d.filename))]
+
+
+def _format_of(path: str, fmt: str) -> str:
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def cmd_check(args) -> int:
+    status = 0
+    for dataset in _datasets(args.datasets, args.data_dir):
+        report = data_io.check_dataset(dataset, args.data_dir)
+        print(("OK    " if report.ok else "FAIL  ") + report.summary())
+        if not report.ok:
+            status = 1
+    return status
+
+
+def cmd_export(args) -> int:
+    fmt = args.format or "jsonl"
+    if args.out != "-":
+        os.makedirs(args.out, exist_ok=True)
+    for dataset in _datasets(args.datasets, args.data_dir):
+        if args.out == "-":
+            count = data_io.export_dataset(dataset, sys.stdout, fmt, args.data_dir)
+        else:
+            path = os.path.join(args.out, f"{dataset.name}.{fmt}")
+            with open(path, "w", encoding="utf-8", newline="") as out:
+                count = data_io.export_dataset(dataset, out, fmt, args.data_dir)
+        print(f"Exported {count} {dataset.name} records.", file=sys.stderr)
+    return 0
+
+
+def cmd_import(args) -> int:
+    dataset = data_io.get_dataset(args.dataset)
+    fmt = _format_of(args.file, args.format)
+    if args.file == "-":
+        report = data_io.import_dataset(dataset, sys.stdin, fmt, args.replace, args.dry_run, args.data_dir)
+    else:
+        with open(args.file, "r", encoding="utf-8", newline="") as source:
+            report = data_io.import_dataset(dataset, source, fmt, args.replace, args.dry_run, args.data_dir)
+    print(("(dry run) " if args.dry_run else "") + report.summary())
+    return 1 if report.invalid else 0
+
+
+def cmd_normalize(args) -> int:
+    for dataset in _datasets(args.datasets, args.data_dir):
+        print(data_io.normalize_dataset(dataset, args.data_dir).summary())
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Church Community Bot data tool")
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("check", help="report corrupt, invalid, duplicate and non-canonical records")
+    p.add_argument("datasets", nargs="*")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("export", help="stream datasets to JSON-lines or CSV")
+    p.add_argument("--format", choices=("jsonl", "csv"))
+    p.add_argument("--out", default="export", help="output directory, or - for stdout")
+    p.add_argument("datasets", nargs="*")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="merge (or --replace) records from JSON-lines or CSV")
+    p.add_argument("--format", choices=("jsonl", "csv"), help="default: from the file extension")
+    p.add_argument("--replace", action="store_true", help="discard existing records")
+    p.add_argument("--dry-run", action="store_true", help="validate only; write nothing")
+    p.add_argument("dataset")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("normalize", help="rewrite datasets in canonical form, dropping duplicates")
+    p.add_argument("datasets", nargs="*")
+    p.set_defaults(func=cmd_normalize)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (KeyError, RuntimeError, data_io.CorruptDataError) as e:
+        print(f"error: {e.args[0] if isinstance(e, KeyError) else e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,21 @@
 # handlers/admin_handlers.py
 import os
-import json
+import asyncio
 import logging
 from functools import wraps
 from typing import Callable, Any
 
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
+from utils.json_utils import load_json, save_json
+from utils import backup_utils
+from utils.analytics import build_report
+from utils.broadcast_utils import BroadcastAborted, fan_out
+from utils.media_utils import BroadcastPayload, media_asset_path, remember_album_message
+from utils.segments import KINDS, QueryError, segments, valid_tag
+from utils.multilingual import LanguageDraft, add_draft, pop_draft
+from utils.router import router
 from utils.bot_utils import add_admin, get_admins, remove_admin, add_event, clear_events, get_groups, is_admin
 
 logger = logging.getLogger("ChurchBot.admin_handlers")
@@ -18,23 +26,11 @@ USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
 # --- Users persistence helpers ---
 def load_users():
-    if not os.path.exists(USERS_FILE):
-        return []
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        logger.exception("Failed to load users.json; returning empty list.")
-        return []
+    return load_json(USERS_FILE, [])
 
 
 def save_users(users):
-    try:
-        os.makedirs(DATA_DIR, exist_ok=True)
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
-    except Exception:
-        logger.exception("Failed to save users.json")
+    save_json(USERS_FILE, users)
 
 
 # --- Admin-only decorator ---
@@ -88,26 +84,51 @@ async def deladmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("User not found in admins.")
 
 
+# --- Broadcast payloads ---
+def _build_payload(update: Update, context: ContextTypes.DEFAULT_TYPE, args=None):
+    """
+    Reply to a message (text, photo, video, document or album) to broadcast it;
+    add `copy` to use copyMessage. `file <name>` sends an asset from MEDIA_DIR,
+    uploading it once. Otherwise the command arguments are sent as text.
+    """
+    args = context.args or [] if args is None else args
+    reply = update.message.reply_to_message
+    if reply is not None:
+        return BroadcastPayload.from_message(reply, copy=bool(args) and args[0].lower() == "copy")
+    if len(args) >= 2 and args[0].lower() == "file":
+        path = media_asset_path(args[1])
+        if path is None:
+            return None
+        return BroadcastPayload.from_path(path, caption=" ".join(args[2:]) or None)
+    if args:
+        return BroadcastPayload.from_text(" ".join(args))
+    return None
+
+
+def _aborted_text(e: BroadcastAborted) -> str:
+    return f"🛑 Broadcast aborted: the message was rejected.\n{e}\nFix the message and try again."
+
+
 # --- Broadcast to groups (uses get_groups from utils.bot_utils) ---
 @admin_only
 async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not context.args:
-        await update.message.reply_text("⚠️ Provide a message to broadcast. Usage: /broadcast <message>")
+    payload = _build_payload(update, context)
+    if payload is None:
+        await update.message.reply_text(
+            "⚠️ Provide a message to broadcast. Usage: /broadcast <message>, "
+            "reply to a message with /broadcast [copy], or /broadcast file <name> [caption]"
+        )
         return
-    message = " ".join(context.args)
     groups = get_groups()
     if not groups:
         await update.message.reply_text("ℹ️ No groups registered to broadcast to.")
         return
 
-    success, fail = 0, 0
-    for group_id in groups:
-        try:
-            await context.bot.send_message(chat_id=int(group_id), text=message)
-            success += 1
-        except Exception as e:
-            logger.exception("Failed to send broadcast to group %s: %s", group_id, e)
-            fail += 1
+    try:
+        success, fail = await fan_out("group", groups, lambda chat_id: payload.send(context.bot, chat_id))
+    except BroadcastAborted as e:
+        await update.message.reply_text(_aborted_text(e))
+        return
 
     await update.message.reply_text(f"📢 Broadcast complete.\n✅ Success: {success}, ❌ Fail: {fail}")
 
@@ -115,27 +136,224 @@ async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- Broadcast to tracked users (users.json) ---
 @admin_only
 async def broadcast_users_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not context.args:
-        await update.message.reply_text("⚠️ Provide a message to broadcast. Usage: /broadcast_users <message>")
+    payload = _build_payload(update, context)
+    if payload is None:
+        await update.message.reply_text(
+            "⚠️ Provide a message to broadcast. Usage: /broadcast_users <message>, "
+            "reply to a message with /broadcast_users [copy], or /broadcast_users file <name> [caption]"
+        )
         return
-    message = " ".join(context.args)
     users = load_users()
     if not users:
         await update.message.reply_text("ℹ️ No users tracked for broadcasting.")
         return
 
-    success, fail = 0, 0
-    for user_id in users:
-        try:
-            await context.bot.send_message(chat_id=int(user_id), text=message)
-            success += 1
-        except Exception as e:
-            logger.exception("Failed to send broadcast to user %s: %s", user_id, e)
-            fail += 1
+    try:
+        success, fail = await fan_out("user", users, lambda chat_id: payload.send(context.bot, chat_id))
+    except BroadcastAborted as e:
+        await update.message.reply_text(_aborted_text(e))
+        return
 
     await update.message.reply_text(f"📢 User broadcast complete.\n✅ Success: {success}, ❌ Fail: {fail}")
 
 
+# --- Audience segments ---
+def _tag_target(update: Update, args):
+    """
+    Parse `<group|user> <id> <tags...>`; inside a group, bare `<tags...>`
+    targets that group. Returns (kind, chat_id, tags) or None.
+    """
+    if len(args) >= 3 and args[0].lower() in KINDS:
+        return args[0].lower(), args[1], [t.lower() for t in args[2:]]
+    chat = update.effective_chat
+    if args and chat is not None and chat.type in ("group", "supergroup") and args[0].lower() not in KINDS:
+        return "group", str(chat.id), [t.lower() for t in args]
+    return None
+
+
+@admin_only
+async def tag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    target = _tag_target(update, context.args or [])
+    if target is None:
+        await update.message.reply_text("⚠️ Usage: /tag <group|user> <id> <tag> [tag ...] (or /tag <tag ...> inside a group)")
+        return
+    kind, chat_id, tags = target
+    invalid = [t for t in tags if not valid_tag(t)]
+    if invalid:
+        await update.message.reply_text(f"⚠️ Invalid tag(s): {', '.join(invalid)}. Use a-z, 0-9, _ : -")
+        return
+    added = segments.tag(kind, chat_id, tags)
+    await update.message.reply_text(
+        f"🏷️ {kind} {chat_id}: " + (f"added {', '.join(added)}" if added else "no new tags")
+    )
+
+
+@admin_only
+async def untag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    target = _tag_target(update, context.args or [])
+    if target is None:
+        await update.message.reply_text("⚠️ Usage: /untag <group|user> <id> <tag> [tag ...] (or /untag <tag ...> inside a group)")
+        return
+    kind, chat_id, tags = target
+    removed = segments.untag(kind, chat_id, tags)
+    await update.message.reply_text(
+        f"🏷️ {kind} {chat_id}: " + (f"removed {', '.join(removed)}" if removed else "no matching tags")
+    )
+
+
+@admin_only
+async def tags_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    if len(args) >= 2 and args[0].lower() in KINDS:
+        tags = segments.tags_of(args[0].lower(), args[1])
+        await update.message.reply_text(f"🏷️ {args[0].lower()} {args[1]}: {', '.join(tags) or 'no tags'}")
+        return
+    counts = segments.tag_counts()
+    if not counts:
+        await update.message.reply_text("ℹ️ No tags yet. Use /tag to add some.")
+        return
+    await update.message.reply_text("🏷️ Tags:\n" + "\n".join(f"{tag}: {n}" for tag, n in counts.items()))
+
+
+@admin_only
+async def audience_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = " ".join(context.args or [])
+    if not query:
+        await update.message.reply_text("⚠️ Usage: /audience <query>, e.g. /audience youth AND yangon (opted-out users are always excluded)")
+        return
+    try:
+        groups, users = segments.count(query)
+    except QueryError as e:
+        await update.message.reply_text(f"⚠️ Invalid query: {e}")
+        return
+    await update.message.reply_text(f"🎯 {query}\n👥 Groups: {groups}\n👤 Users: {users}")
+
+
+@admin_only
+async def broadcast_to_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_to <query> | <message>, or reply with /broadcast_to <query> [| copy]."""
+    args = context.args or []
+    if "|" in args:
+        split = args.index("|")
+        query, payload_args = " ".join(args[:split]), args[split + 1:]
+    else:
+        query, payload_args = " ".join(args), []
+    payload = _build_payload(update, context, payload_args) if query else None
+    if payload is None:
+        await update.message.reply_text(
+            "⚠️ Usage: /broadcast_to <query> | <message>, or reply to a message with "
+            "/broadcast_to <query> [| copy]. Example: /broadcast_to youth AND yangon | Hello!"
+        )
+        return
+    try:
+        audience = segments.audience(query)
+    except QueryError as e:
+        await update.message.reply_text(f"⚠️ Invalid query: {e}")
+        return
+
+    success = fail = 0
+    try:
+        for kind in KINDS:
+            ok, failed = await fan_out(kind, audience[kind], lambda chat_id: payload.send(context.bot, chat_id))
+            success += ok
+            fail += failed
+    except BroadcastAborted as e:
+        await update.message.reply_text(_aborted_text(e))
+        return
+    if success + fail == 0:
+        await update.message.reply_text(f"ℹ️ No recipients match: {query}")
+        return
+    await update.message.reply_text(f"📢 Targeted broadcast complete.\n✅ Success: {success}, ❌ Fail: {fail}")
+
+
+# --- Per-language broadcasts ---
+def _split_query(args, has_reply: bool):
+    """
+    `<query> | <message>` -> (query, message args). Without `|`, a reply
+    treats all args as the query and a plain command treats them as the
+    message, with the whole audience ("all") as the query. Opted-out
+    recipients are excluded from every query, "all" included.
+    """
+    if "|" in args:
+        split = args.index("|")
+        return " ".join(args[:split]) or "all", args[split + 1:]
+    if has_reply:
+        return " ".join(args) or "all", []
+    return "all", args
+
+
+@admin_only
+async def broadcast_lang_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Translate once per recipient language, preview every variant, send after approval."""
+    args = context.args or []
+    query, payload_args = _split_query(args, update.message.reply_to_message is not None)
+    payload = _build_payload(update, context, payload_args)
+    if payload is None:
+        await update.message.reply_text(
+            "⚠️ Usage: /broadcast_lang <message>, /broadcast_lang <query> | <message>, "
+            "or reply to a message with /broadcast_lang [query]"
+        )
+        return
+    draft = LanguageDraft(payload, query, update.effective_user.id)
+    try:
+        await draft.prepare()
+    except QueryError as e:
+        await update.message.reply_text(f"⚠️ Invalid query: {e}")
+        return
+    except Exception:
+        logger.exception("Failed to prepare language broadcast.")
+        await update.message.reply_text("❌ Translation failed.\nဘာသာပြန်မအောင်မြင်ပါ။")
+        return
+    if not draft.counts:
+        await update.message.reply_text(f"ℹ️ No recipients match: {query}")
+        return
+
+    add_draft(draft)
+    *summary, last = draft.preview()
+    for text in summary:
+        await update.message.reply_text(text)
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ Send", callback_data=f"broadcast:send:{draft.id}"),
+        InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast:cancel:{draft.id}"),
+    ]])
+    await update.message.reply_text(last + "\n\nSend these variants? / ပို့မလား?", reply_markup=keyboard)
+
+
+async def broadcast_lang_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("⛔ Admins only.", show_alert=True)
+        return
+    await query.answer()
+    _, action, draft_id = query.data.split(":", 2)
+    draft = pop_draft(draft_id)
+    if draft is None:
+        await query.edit_message_reply_markup(None)
+        await query.message.reply_text("ℹ️ This broadcast draft has expired or was already handled.")
+        return
+    if action != "send":
+        await query.edit_message_reply_markup(None)
+        await query.message.reply_text("❌ Broadcast cancelled.")
+        return
+
+    await query.edit_message_reply_markup(None)
+    await query.message.reply_text("📤 Sending…")
+    success, fail = await draft.send(context.bot)
+    text = f"📢 Language broadcast complete.\n✅ Success: {success}, ❌ Fail: {fail}"
+    for language, error in draft.aborted.items():
+        text += f"\n🛑 [{language}] aborted, the message was rejected: {error}"
+    await query.message.reply_text(text)
+
+
+# --- Album collection for /broadcast replies ---
+async def collect_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.effective_message
+    user = update.effective_user
+    if message is None or not message.media_group_id or not user or not is_admin(user.id):
+        return
+    remember_album_message(message)
+
+
 # --- Events management ---
 @admin_only
 async def addevent(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -159,3 +377,118 @@ async def clearevents(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         logger.exception("Failed to clear events.")
         await update.message.reply_text("❌ Failed to clear events.")
+
+
+# --- Snapshots ---
+@admin_only
+async def snapshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        snapshot_id = await asyncio.to_thread(backup_utils.take_snapshot)
+    except Exception:
+        logger.exception("Manual snapshot failed.")
+        await update.message.reply_text("❌ Snapshot failed.")
+        return
+    if snapshot_id:
+        await update.message.reply_text(f"💾 Snapshot {snapshot_id} saved.")
+    else:
+        await update.message.reply_text("ℹ️ Nothing changed since the last snapshot.")
+
+
+@admin_only
+async def snapshots(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    ids = backup_utils.list_snapshots()
+    if not ids:
+        await update.message.reply_text("No snapshots yet.")
+        return
+    await update.message.reply_text("Snapshots (newest last):\n" + "\n".join(ids[-20:]))
+
+
+@admin_only
+async def restore(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text(
+            "⚠️ Usage: /restore <latest|snapshot_id|YYYY-MM-DDTHH:MM> [dataset]\n"
+            "Example: /restore 2026-10-19T08:00 users"
+        )
+        return
+    dataset = context.args[1] if len(context.args) > 1 else None
+    try:
+        snapshot_id = backup_utils.find_snapshot(context.args[0])
+    except ValueError:
+        await update.message.reply_text("⚠️ Could not read that time. Use a snapshot ID or YYYY-MM-DDTHH:MM (UTC).")
+        return
+    if snapshot_id is None:
+        await update.message.reply_text("ℹ️ No snapshot exists at or before that time.")
+        return
+    try:
+        # Snapshot current state first so the restore itself can be undone;
+        # the target is pinned so that snapshot's retention cannot remove it.
+        await asyncio.to_thread(backup_utils.take_snapshot, pinned=[snapshot_id])
+        restored = await asyncio.to_thread(backup_utils.restore, snapshot_id, dataset)
+    except FileNotFoundError:
+        await update.message.reply_text(f"ℹ️ Snapshot {snapshot_id} no longer exists.")
+        return
+    except Exception:
+        logger.exception("Restore from %s failed.", snapshot_id)
+        await update.message.reply_text("❌ Restore failed.")
+        return
+    if not restored:
+        if dataset is None:
+            await update.message.reply_text(f"ℹ️ Snapshot {snapshot_id} contains no datasets.")
+        else:
+            await update.message.reply_text(f"ℹ️ Snapshot {snapshot_id} has no dataset named {dataset}.")
+        return
+    await update.message.reply_text(f"♻️ Restored {', '.join(restored)} from snapshot {snapshot_id}.")
+
+
+# --- Analytics ---
+@admin_only
+async def analytics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    group_id = context.args[0] if context.args else None
+    try:
+        report = await build_report(group_id)
+    except Exception:
+        logger.exception("Failed to render analytics.")
+        await update.message.reply_text("❌ Could not build the analytics report.")
+        return
+    await update.message.reply_text(report)
+
+
+# --- Runtime feature switches ---
+@admin_only
+async def feature(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    if len(args) == 2 and args[1].lower() in ("on", "off"):
+        name = args[0].lower().lstrip("/")
+        if name == "feature":
+            await update.message.reply_text("⚠️ /feature cannot be disabled.")
+            return
+        if router.set_enabled(name, args[1].lower() == "on"):
+            await update.message.reply_text(f"✅ {name} turned {args[1].lower()}.")
+        else:
+            await update.message.reply_text(f"⚠️ Unknown feature or command: {name}")
+        return
+    lines = ["⚙️ Features:"] + [f"{name}: {'on' if on else 'off'}" for name, on in sorted(router.features.items())]
+    if router.disabled_commands:
+        lines.append("Disabled commands: " + ", ".join(f"/{c}" for c in sorted(router.disabled_commands)))
+    lines.append("\nUsage: /feature <feature|command> on|off")
+    await update.message.reply_text("\n".join(lines))
+
+
+# --- Connectivity status ---
+@admin_only
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from supervisor import monitor
+
+    state = monitor.state
+    lines = [
+        "🩺 Bot status",
+        f"Last processed update: {state.get('last_update_id')}",
+        f"Outages: {state.get('outages', 0)} (total {state.get('total_outage_seconds', 0.0):.0f}s)",
+    ]
+    if "last_outage_seconds" in state:
+        lines.append(f"Last outage: {state['last_outage_seconds']:.0f}s, recovery {state.get('last_recovery_seconds', 0.0):.1f}s")
+    if monitor.in_outage:
+        lines.append("⚠️ Telegram currently unreachable; reconnecting.")
+    await update.message.reply_text("\n".join(lines))
+
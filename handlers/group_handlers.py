@@ -1,12 +1,15 @@
 # handlers/group_handlers.py
 import os
-import json
 import logging
 from typing import List
 
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from utils.json_utils import load_json, save_json, update_json
+from utils.chat_health import tracker
+from utils.segments import segments
+
 logger = logging.getLogger("ChurchBot.group_handlers")
 
 DATA_DIR = os.getenv("DATA_DIR", "data")
@@ -22,26 +25,45 @@ def _ensure_data_dir() -> None:
 
 def load_groups() -> List[str]:
     _ensure_data_dir()
-    if not os.path.exists(GROUPS_FILE):
-        return []
-    try:
-        with open(GROUPS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return [str(x) for x in data]
-            return []
-    except Exception:
-        logger.exception("Failed to load groups.json; returning empty list.")
-        return []
+    data = load_json(GROUPS_FILE, [])
+    if isinstance(data, list):
+        return [str(x) for x in data]
+    return []
 
 
 def save_groups(groups: List[str]) -> None:
     _ensure_data_dir()
-    try:
-        with open(GROUPS_FILE, "w", encoding="utf-8") as f:
-            json.dump(groups, f, ensure_ascii=False, indent=2)
-    except Exception:
-        logger.exception("Failed to save groups.json")
+    save_json(GROUPS_FILE, groups)
+
+
+def add_group_id(group_id: str) -> bool:
+    """Register a group under the dataset lock. Returns False if already present."""
+    def mutate(groups) -> bool:
+        groups[:] = [str(x) for x in groups]
+        if group_id in groups:
+            return False
+        groups.append(group_id)
+        return True
+    _ensure_data_dir()
+    added = update_json(GROUPS_FILE, mutate, [])
+    if added:
+        segments.member_added("group", group_id)
+    return added
+
+
+def remove_group_id(group_id: str) -> bool:
+    """Remove a group under the dataset lock. Returns False if it was not registered."""
+    def mutate(groups) -> bool:
+        groups[:] = [str(x) for x in groups]
+        if group_id not in groups:
+            return False
+        groups.remove(group_id)
+        return True
+    _ensure_data_dir()
+    removed = update_json(GROUPS_FILE, mutate, [])
+    if removed:
+        segments.member_removed("group", group_id)
+    return removed
 
 
 async def addgroup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -49,10 +71,7 @@ async def addgroup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("⚠️ Provide a group ID.\nUsage: /addgroup <group_id>")
         return
     group_id = str(context.args[0])
-    groups = load_groups()
-    if group_id not in groups:
-        groups.append(group_id)
-        save_groups(groups)
+    if add_group_id(group_id):
         await update.message.reply_text(f"✅ Group {group_id} added.\nGroup {group_id} ထည့်ပြီးပါပြီ။")
         logger.info("Group %s added by user %s", group_id, update.effective_user.id if update.effective_user else "unknown")
     else:
@@ -72,10 +91,7 @@ async def delgroup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("⚠️ Provide a group ID to remove.\nUsage: /delgroup <group_id>")
         return
     group_id = str(context.args[0])
-    groups = load_groups()
-    if group_id in groups:
-        groups.remove(group_id)
-        save_groups(groups)
+    if remove_group_id(group_id):
         await update.message.reply_text(f"❌ Group {group_id} removed.\nGroup {group_id} ဖယ်ရှားပြီးပါပြီ။")
         logger.info("Group %s removed by user %s", group_id, update.effective_user.id if update.effective_user else "unknown")
     else:
@@ -100,12 +116,20 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
     new_status = getattr(new_member, "status", "unknown")
     chat_id_str = str(chat.id)
 
+    # Private chats: the user blocked (kicked) or unblocked the bot.
+    if chat.type == "private":
+        if new_status in ("kicked", "left"):
+            tracker.prune("user", chat_id_str, "blocked")
+        elif new_status == "member":
+            tracker.mark_alive("user", chat_id_str)
+        tracker.flush()
+        logger.debug("my_chat_member update in private chat %s: %s -> %s", chat.id, old_status, new_status)
+        return
+
     # When bot is added or promoted to admin/member -> register group
     if new_status in ("administrator", "member"):
-        groups = load_groups()
-        if chat_id_str not in groups:
-            groups.append(chat_id_str)
-            save_groups(groups)
+        tracker.mark_alive("group", chat_id_str)
+        if add_group_id(chat_id_str):
             try:
                 await context.bot.send_message(chat.id, "✅ Group registered automatically.")
             except Exception:
@@ -114,11 +138,9 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # When bot is kicked or left -> remove group
     elif new_status in ("kicked", "left"):
-        groups = load_groups()
-        if chat_id_str in groups:
-            groups.remove(chat_id_str)
-            save_groups(groups)
+        if tracker.prune("group", chat_id_str, new_status):
             logger.info("Removed group %s after bot left or was kicked (new_status=%s)", chat.id, new_status)
+    tracker.flush()
 
     logger.debug(
         "my_chat_member update: chat=%s (%s) old_status=%s new_status=%s",
@@ -127,3 +149,12 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         old_status,
         new_status,
     )
+
+
+async def on_chat_migrated(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Follow a group -> supergroup upgrade so broadcasts keep reaching it."""
+    message = update.effective_message
+    if message is None or not message.migrate_to_chat_id:
+        return
+    tracker.migrate("group", message.chat_id, message.migrate_to_chat_id)
+    tracker.flush()
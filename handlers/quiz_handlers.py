@@ -4,6 +4,7 @@ from telegram.ext import ContextTypes
 import logging
 import os
 import json
+import time
 
 logger = logging.getLogger("ChurchBot.quiz_handlers")
 
@@ -37,6 +38,7 @@ async def quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     context.user_data["quiz_index"] = 0
     context.user_data["score"] = 0
+    context.user_data["quiz_updated"] = time.time()
     await send_question(update, context, 0)
 
 async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, idx: int):
@@ -46,7 +48,7 @@ async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, idx:
     labels = ["A", "B", "C", "D"]
     for i, choice in enumerate(q.get("choices", [])):
         label = labels[i] if i < len(labels) else str(i)
-        keyboard.append([InlineKeyboardButton(choice, callback_data=label)])
+        keyboard.append([InlineKeyboardButton(choice, callback_data=f"quiz:{label}")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     # If called from callback, edit or send new message accordingly
     if update.callback_query:
@@ -57,12 +59,16 @@ async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, idx:
 async def quiz_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+    if "quiz_index" not in context.user_data:
+        # Finished, expired, or never started (e.g. a button from an old quiz).
+        await query.edit_message_text("No active quiz. Send /quiz to start a new one.")
+        return
     idx = context.user_data.get("quiz_index", 0)
     if idx >= len(QUIZ_QUESTIONS):
         await query.edit_message_text("Quiz already finished.")
         return
     q = QUIZ_QUESTIONS[idx]
-    choice = query.data
+    choice = query.data.rpartition(":")[2]  # "quiz:C"; buttons sent before namespacing are just "C"
     correct = q.get("answer")
     if choice == correct:
         context.user_data["score"] = context.user_data.get("score", 0) + 1
@@ -77,6 +83,7 @@ async def quiz_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Next question
     idx += 1
     context.user_data["quiz_index"] = idx
+    context.user_data["quiz_updated"] = time.time()
     if idx < len(QUIZ_QUESTIONS):
         # Send next question
         await send_question(update, context, idx)
@@ -87,3 +94,4 @@ async def quiz_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Clear quiz state
         context.user_data.pop("quiz_index", None)
         context.user_data.pop("score", None)
+        context.user_data.pop("quiz_updated", None)
@@ -1,10 +1,14 @@
 # handlers/user_handlers.py
 import os
-import json
+import asyncio
 import logging
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
+from utils.json_utils import load_json, save_json, update_json
 from utils.translate_utils import translate_auto
+from utils.segments import OPT_OUT_TAG, segments, valid_tag
+from utils.bot_utils import is_admin
+from utils.multilingual import LANGUAGES, language_of, set_language
 
 logger = logging.getLogger("ChurchBot.user_handlers")
 
@@ -15,23 +19,20 @@ USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
 
 def load_data(file):
-    if not os.path.exists(file):
-        return []
-    try:
-        with open(file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        logger.exception("Failed to load %s", file)
-        return []
+    return load_json(file, [])
 
 
 def save_data(file, data):
-    try:
-        os.makedirs(DATA_DIR, exist_ok=True)
-        with open(file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception:
-        logger.exception("Failed to save %s", file)
+    save_json(file, data)
+
+
+def _append_if_missing(item):
+    def mutate(items) -> bool:
+        if item in items:
+            return False
+        items.append(item)
+        return True
+    return mutate
 
 
 # Start command
@@ -43,7 +44,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Available commands:\n"
-        "/verse\n/prayer <text>\n/prayerlist\n/events\n/daily_inspiration\n/myid\n/chatid\n/tran\n\n"
+        "/verse\n/prayer <text>\n/prayerlist\n/events\n/daily_inspiration\n/myid\n/chatid\n/tran\n"
+        "/subscribe <topic>\n/unsubscribe <topic>\n/optout\n/optin\n/language <code>\n\n"
         )
 
 
@@ -57,23 +59,55 @@ async def prayer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("🙏 Please share your prayer request.\n")
         return
-    prayers = load_data(PRAYERS_FILE)
     request = " ".join(context.args)
-    prayers.append({"user": update.effective_user.id, "text": request})
-    save_data(PRAYERS_FILE, prayers)
+    entry = {"user": str(update.effective_user.id), "text": request}
+    update_json(PRAYERS_FILE, lambda prayers: prayers.append(entry) or True, [])
     await update.message.reply_text("✅ Prayer request added.\n")
 
 
-# Prayer list
+# Prayer list (paged; buttons use the "page:prayers:<n>" callback namespace)
+PRAYERS_PER_PAGE = 10
+
+
+def _prayer_page(prayers, page: int):
+    pages = max(1, (len(prayers) + PRAYERS_PER_PAGE - 1) // PRAYERS_PER_PAGE)
+    page = min(max(page, 0), pages - 1)
+    start = page * PRAYERS_PER_PAGE
+    text = "🙏 Prayer Requests:\n"
+    for p in prayers[start:start + PRAYERS_PER_PAGE]:
+        text += f"- {p['text']} (User {p['user']})\n"
+    if pages == 1:
+        return text, None
+    text += f"\nPage {page + 1}/{pages}"
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"page:prayers:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"page:prayers:{page + 1}"))
+    return text, InlineKeyboardMarkup([buttons])
+
+
 async def prayerlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     prayers = load_data(PRAYERS_FILE)
     if not prayers:
         await update.message.reply_text("🙏 Prayer list is empty.\n")
     else:
-        text = "🙏 Prayer Requests:\n"
-        for p in prayers:
-            text += f"- {p['text']} (User {p['user']})\n"
-        await update.message.reply_text(text)
+        text, markup = _prayer_page(prayers, 0)
+        await update.message.reply_text(text, reply_markup=markup)
+
+
+async def page_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, listing, page = query.data.split(":", 2)
+    if listing != "prayers" or not page.isdigit():
+        return
+    prayers = load_data(PRAYERS_FILE)
+    if not prayers:
+        await query.edit_message_text("🙏 Prayer list is empty.\n")
+        return
+    text, markup = _prayer_page(prayers, int(page))
+    await query.edit_message_text(text, reply_markup=markup)
 
 
 # Events
@@ -125,21 +159,85 @@ async def tran(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        translated = translate_auto(text, target)
+        translated = await asyncio.to_thread(translate_auto, text, target)
         await update.message.reply_text(f"🌐 Translation:\nOriginal: {text}\nTranslated: {translated}")
     except Exception as e:
         logger.exception("Translation failed: %s", e)
         await update.message.reply_text("❌ Translation failed.\nဘာသာပြန်မအောင်မြင်ပါ။")
 
 
+# Opt-in topics (stored as "topic:<name>" tags, see utils.segments)
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not context.args:
+        topics = [t[len("topic:"):] for t in segments.tags_of("user", user_id) if t.startswith("topic:")]
+        await update.message.reply_text(
+            "📬 Your topics: " + (", ".join(topics) or "none") + "\nUsage: /subscribe <topic>"
+        )
+        return
+    topic = context.args[0].lower()
+    if not valid_tag("topic:" + topic):
+        await update.message.reply_text("⚠️ Topic names may use a-z, 0-9, _ and -.")
+        return
+    segments.tag("user", user_id, ["topic:" + topic])
+    await update.message.reply_text(f"✅ Subscribed to {topic}.")
+
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("⚠️ Usage: /unsubscribe <topic>")
+        return
+    topic = context.args[0].lower()
+    if segments.untag("user", update.effective_user.id, ["topic:" + topic]):
+        await update.message.reply_text(f"✅ Unsubscribed from {topic}.")
+    else:
+        await update.message.reply_text(f"ℹ️ You are not subscribed to {topic}.")
+
+
+async def optout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    segments.tag("user", update.effective_user.id, [OPT_OUT_TAG])
+    await update.message.reply_text("🔕 You will no longer receive targeted broadcasts. Use /optin to undo.")
+
+
+async def optin(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    segments.untag("user", update.effective_user.id, [OPT_OUT_TAG])
+    await update.message.reply_text("🔔 Targeted broadcasts are back on.")
+
+
+# Preferred broadcast language (per user in private chats, per group in groups)
+async def language(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    if chat.type in ("group", "supergroup"):
+        kind, chat_id = "group", chat.id
+        if context.args and not is_admin(update.effective_user.id):
+            await update.message.reply_text("⛔ Only admins can set a group's language.")
+            return
+    else:
+        kind, chat_id = "user", update.effective_user.id
+    choices = ", ".join(LANGUAGES)
+    if not context.args:
+        current = language_of(kind, chat_id) or "not set"
+        await update.message.reply_text(
+            f"🌐 Broadcast language: {current}\nUsage: /language <{'|'.join(LANGUAGES)}>\n"
+            f"ဘာသာစကား ရွေးပါ: {choices}"
+        )
+        return
+    code = context.args[0].lower()
+    if code not in LANGUAGES:
+        await update.message.reply_text(f"⚠️ Supported languages: {choices}")
+        return
+    set_language(kind, chat_id, code)
+    await update.message.reply_text(f"✅ Broadcasts will be sent in: {code}")
+
+
 # Track user (save to users.json)
 async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     username = update.effective_user.username or "NoUsername"
     users = load_data(USERS_FILE)
-    if user_id not in users:
-        users.append(user_id)
-        save_data(USERS_FILE, users)
+    # Cheap unlocked check first; only take the lock when the user is new.
+    if user_id not in users and update_json(USERS_FILE, _append_if_missing(user_id), []):
+        segments.member_added("user", user_id)
         logger.info("Tracked new user %s (%s)", user_id, username)
     else:
         logger.debug("User %s (%s) already tracked", user_id, username)
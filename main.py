@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
 import os
 import sys
-import time
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -27,13 +27,12 @@ except Exception:
         Request = None
 
 from telegram import Update
-from telegram.error import NetworkError
 from telegram.ext import (
     ApplicationBuilder,
-    CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     ChatMemberHandler,
+    TypeHandler,
     filters,
 )
 
@@ -42,6 +41,10 @@ load_dotenv()
 import config
 from utils.json_utils import init_data_files
 from utils.bot_utils import error_handler as bot_error_handler
+from utils.flood_control import flood_guard
+from utils.analytics import record_update
+from utils.persistence import SessionPersistence
+from utils.router import CommandRouter, router
 from handlers import (
     user_handlers,
     quiz_handlers,
@@ -49,6 +52,7 @@ from handlers import (
     group_handlers,
 )
 from scheduler import start_scheduler
+from supervisor import supervise, track_processed
 
 DATA_DIR = getattr(config, "DATA_DIR", "data")
 Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
@@ -83,58 +87,98 @@ def build_request_from_env():
         logger.exception("Failed to build Request object.")
         return None
 
-def safe_add_command(app, command_name: str, handler_module, handler_attr: str):
-    if hasattr(handler_module, handler_attr):
-        handler_func = getattr(handler_module, handler_attr)
-        app.add_handler(CommandHandler(command_name, handler_func))
-        logger.debug("Registered /%s -> %s.%s", command_name, handler_module.__name__, handler_attr)
-    else:
-        logger.debug("Skipping /%s; handler not found.", command_name)
-
-def safe_add_callback(app, handler_module, handler_attr: str):
-    if hasattr(handler_module, handler_attr):
-        handler_func = getattr(handler_module, handler_attr)
-        app.add_handler(CallbackQueryHandler(handler_func))
-        logger.debug("Registered CallbackQueryHandler -> %s.%s", handler_module.__name__, handler_attr)
-    else:
-        logger.debug("Skipping CallbackQueryHandler; handler not found.")
+# Every command and callback namespace, routed by dict lookup (see utils/router.py).
+# The third column ties a route to an ENABLE_* feature switch.
+COMMANDS = (
+    ("start", user_handlers.start, None),
+    ("cmd", user_handlers.cmd, None),
+    ("verse", user_handlers.verse, None),
+    ("prayer", user_handlers.prayer, None),
+    ("prayerlist", user_handlers.prayerlist, None),
+    ("events", user_handlers.events, None),
+    ("daily_inspiration", user_handlers.daily, None),
+    ("myid", user_handlers.myid, None),
+    ("chatid", user_handlers.chatid, None),
+    ("tran", user_handlers.tran, "translation"),
+    ("subscribe", user_handlers.subscribe, None),
+    ("unsubscribe", user_handlers.unsubscribe, None),
+    ("optout", user_handlers.optout, None),
+    ("optin", user_handlers.optin, None),
+    ("language", user_handlers.language, None),
+
+    ("quiz", quiz_handlers.quiz, "quiz"),
+
+    ("addadmin", admin_handlers.addadmin, None),
+    ("listadmins", admin_handlers.listadmins, None),
+    ("deladmin", admin_handlers.deladmin, None),
+    ("broadcast", admin_handlers.broadcast_cmd, "broadcast"),
+    ("broadcast_users", admin_handlers.broadcast_users_cmd, "broadcast"),
+    ("broadcast_to", admin_handlers.broadcast_to_cmd, "broadcast"),
+    ("broadcast_lang", admin_handlers.broadcast_lang_cmd, "broadcast"),
+    ("audience", admin_handlers.audience_cmd, None),
+    ("tag", admin_handlers.tag_cmd, None),
+    ("untag", admin_handlers.untag_cmd, None),
+    ("tags", admin_handlers.tags_cmd, None),
+    ("addevent", admin_handlers.addevent, None),
+    ("clearevents", admin_handlers.clearevents, None),
+    ("snapshot", admin_handlers.snapshot, None),
+    ("snapshots", admin_handlers.snapshots, None),
+    ("restore", admin_handlers.restore, None),
+    ("analytics", admin_handlers.analytics_cmd, None),
+    ("status", admin_handlers.status, None),
+    ("feature", admin_handlers.feature, None),
+
+    ("addgroup", group_handlers.addgroup, None),
+    ("listgroups", group_handlers.listgroups, None),
+    ("delgroup", group_handlers.delgroup, None),
+)
+
+# Callback data is "<namespace>:<payload>".
+CALLBACKS = (
+    ("quiz", quiz_handlers.quiz_button, "quiz"),
+    ("page", user_handlers.page_button, None),
+    ("broadcast", admin_handlers.broadcast_lang_button, "broadcast"),
+)
+
+FEATURE_FLAGS = {
+    "quiz": "ENABLE_QUIZ",
+    "broadcast": "ENABLE_BROADCAST",
+    "translation": "ENABLE_TRANSLATION",
+}
+
+def register_routes(router: CommandRouter) -> CommandRouter:
+    for name, callback, feature in COMMANDS:
+        router.add_command(name, callback, feature)
+    for namespace, callback, feature in CALLBACKS:
+        router.add_callback(namespace, callback, feature)
+    for feature, flag in FEATURE_FLAGS.items():
+        router.set_enabled(feature, getattr(config, flag, True))
+    return router
 
 def register_handlers(app):
-    safe_add_command(app, "start", user_handlers, "start")
-    safe_add_command(app, "cmd", user_handlers, "cmd")
-    safe_add_command(app, "verse", user_handlers, "verse")
-    safe_add_command(app, "prayer", user_handlers, "prayer")
-    safe_add_command(app, "prayerlist", user_handlers, "prayerlist")
-    safe_add_command(app, "events", user_handlers, "events")
-    safe_add_command(app, "daily_inspiration", user_handlers, "daily")
-    safe_add_command(app, "myid", user_handlers, "myid")
-    safe_add_command(app, "chatid", user_handlers, "chatid")
-    safe_add_command(app, "tran", user_handlers, "tran")
-
-    safe_add_command(app, "quiz", quiz_handlers, "quiz")
-    safe_add_callback(app, quiz_handlers, "quiz_button")
-
-    safe_add_command(app, "addadmin", admin_handlers, "addadmin")
-    safe_add_command(app, "listadmins", admin_handlers, "listadmins")
-    safe_add_command(app, "deladmin", admin_handlers, "deladmin")
-    safe_add_command(app, "broadcast", admin_handlers, "broadcast_cmd")
-    safe_add_command(app, "broadcast_users", admin_handlers, "broadcast_users_cmd")
-    safe_add_command(app, "addevent", admin_handlers, "addevent")
-    safe_add_command(app, "clearevents", admin_handlers, "clearevents")
-
-    safe_add_command(app, "addgroup", group_handlers, "addgroup")
-    safe_add_command(app, "listgroups", group_handlers, "listgroups")
-    safe_add_command(app, "delgroup", group_handlers, "delgroup")
-
-    if hasattr(user_handlers, "track_user"):
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, user_handlers.track_user))
-        logger.debug("Registered track_user message handler.")
-
-    if hasattr(group_handlers, "on_my_chat_member"):
-        app.add_handler(ChatMemberHandler(group_handlers.on_my_chat_member, chat_member_types=["my_chat_member"]))
-        logger.debug("Registered on_my_chat_member handler.")
+    # Flood control and duplicate-update suppression run ahead of every other handler.
+    app.add_handler(TypeHandler(Update, flood_guard), group=-1)
+
+    register_routes(router)
+    # Same updates CommandHandler accepts: messages and edits, never channel posts.
+    app.add_handler(MessageHandler(filters.COMMAND & filters.UpdateType.MESSAGES, router.dispatch_command))
+    app.add_handler(CallbackQueryHandler(router.dispatch_callback))
+
+    # Separate group so it never shadows the track_user text handler.
+    app.add_handler(MessageHandler(filters.ATTACHMENT, admin_handlers.collect_album), group=1)
+
+    # Analytics tap; a later group than flood control so throttled/duplicate updates are not counted.
+    app.add_handler(TypeHandler(Update, record_update), group=2)
+
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, user_handlers.track_user))
+    app.add_handler(MessageHandler(filters.StatusUpdate.MIGRATE, group_handlers.on_chat_migrated))
+    app.add_handler(ChatMemberHandler(group_handlers.on_my_chat_member, chat_member_types=["my_chat_member"]))
+
+    # Last group: records the processed update offset used to resume after a restart.
+    app.add_handler(TypeHandler(Update, track_processed), group=100)
 
     app.add_error_handler(bot_error_handler)
+    logger.debug("Routed %d commands and %d callback namespaces.", len(router.commands), len(router.callbacks))
 
 def shutdown_scheduler(scheduler):
     if not scheduler:
@@ -159,10 +203,14 @@ def main():
 
     request = build_request_from_env()
     try:
+        builder = ApplicationBuilder().token(bot_token)
+        try:
+            builder = builder.persistence(SessionPersistence())
+        except Exception:
+            logger.exception("Failed to open session persistence; quiz progress will not survive restarts.")
         if request is not None:
-            app = ApplicationBuilder().token(bot_token).request(request).build()
-        else:
-            app = ApplicationBuilder().token(bot_token).build()
+            builder = builder.request(request)
+        app = builder.build()
     except Exception:
         logger.exception("Failed to build Application; check PTB version.")
         raise
@@ -170,49 +218,24 @@ def main():
     register_handlers(app)
 
     scheduler = None
-    try:
-        scheduler = start_scheduler()
-        logger.info("Scheduler started.")
-    except Exception:
-        logger.exception("Failed to start scheduler; continuing without it.")
-        scheduler = None
-
-    max_retries = int(os.getenv("BOT_START_RETRIES", "6"))
-    backoff_base = int(os.getenv("BOT_BACKOFF_SECONDS", "5"))
-    attempt = 0
-
-    while True:
+    if getattr(config, "ENABLE_SCHEDULER", True):
         try:
-            logger.info("Starting bot (attempt %d)", attempt + 1)
-            app.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
-            logger.info("Bot stopped normally.")
-            break
-        except NetworkError as e:
-            attempt += 1
-            logger.exception("NetworkError while running bot: %s", e)
-            if attempt >= max_retries:
-                logger.error("Exceeded max retries (%d). Exiting.", max_retries)
-                shutdown_scheduler(scheduler)
-                sys.exit(1)
-            sleep_for = backoff_base * attempt
-            logger.info("Retrying in %s seconds...", sleep_for)
-            time.sleep(sleep_for)
-        except KeyboardInterrupt:
-            logger.info("KeyboardInterrupt received. Shutting down.")
-            try:
-                app.stop()
-            except Exception:
-                pass
-            shutdown_scheduler(scheduler)
-            sys.exit(0)
-        except Exception as e:
-            logger.exception("Unexpected error: %s", e)
-            try:
-                app.stop()
-            except Exception:
-                pass
-            shutdown_scheduler(scheduler)
-            sys.exit(1)
+            scheduler = start_scheduler(app)
+            logger.info("Scheduler started.")
+        except Exception:
+            logger.exception("Failed to start scheduler; continuing without it.")
+            scheduler = None
+
+    try:
+        asyncio.run(supervise(app, allowed_updates=Update.ALL_TYPES))
+        logger.info("Bot stopped normally.")
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt received. Shutting down.")
+    except Exception as e:
+        logger.exception("Unexpected error: %s", e)
+        shutdown_scheduler(scheduler)
+        sys.exit(1)
+    shutdown_scheduler(scheduler)
 
 if __name__ == "__main__":
     main()
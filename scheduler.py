@@ -1,12 +1,92 @@
 # scheduler.py
+import os
 import logging
+from functools import wraps
+
+from utils.lock_utils import LeaderElector
 
 logger = logging.getLogger("ChurchBot.scheduler")
 
-def start_scheduler():
+DATA_DIR = os.getenv("DATA_DIR", "data")
+LEASE_FILE = os.path.join(DATA_DIR, "scheduler_lease.json")
+
+# Repeating jobs: (callback, interval_seconds, first_delay_seconds, name, leader).
+# Callbacks are PTB job callbacks: async def job(context). Jobs with
+# leader=False (per-process housekeeping) run on every instance.
+JOBS = []
+
+_elector = None
+
+
+def register_job(callback, interval: float, first: float = None, name: str = None, leader: bool = True) -> None:
+    JOBS.append((callback, interval, first if first is not None else interval, name or callback.__name__, leader))
+
+
+def is_leader() -> bool:
+    """True when this process holds the scheduler lease (or no election is running)."""
+    return _elector is None or _elector.is_leader
+
+
+def leader_only(func):
+    """Skip the wrapped job/broadcast on instances that are not the scheduler leader."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not is_leader():
+            logger.debug("Skipping %s; not the scheduler leader.", func.__name__)
+            return None
+        return await func(*args, **kwargs)
+    return wrapper
+
+
+class SchedulerHandle:
+    def __init__(self, elector, jobs):
+        self.elector = elector
+        self.jobs = jobs
+
+    def shutdown(self, wait: bool = False) -> None:
+        global _elector
+        for job in self.jobs:
+            try:
+                job.schedule_removal()
+            except Exception:
+                logger.debug("Could not remove job %s", getattr(job, "name", job))
+        self.elector.stop()
+        _elector = None
+
+
+def register_default_jobs() -> None:
+    from utils import analytics, backup_utils, chat_health, persistence
+
+    registered = {job[3] for job in JOBS}
+    if "dead_chat_sweep" not in registered:
+        register_job(chat_health.sweep_stale_chats, chat_health.SWEEP_INTERVAL, first=60, name="dead_chat_sweep")
+    if "data_snapshot" not in registered:
+        register_job(backup_utils.snapshot_job, backup_utils.SNAPSHOT_INTERVAL, first=30, name="data_snapshot")
+    if "quiz_session_purge" not in registered:
+        register_job(persistence.purge_sessions_job, 3600, first=300, name="quiz_session_purge")
+    if "analytics_flush" not in registered:
+        register_job(analytics.flush_job, analytics.FLUSH_INTERVAL, name="analytics_flush", leader=False)
+
+
+def start_scheduler(app=None):
     """
-    Placeholder scheduler starter. Replace with APScheduler or other scheduler if needed.
-    Returning None is acceptable; main.py handles missing scheduler.
+    Start leader election and register JOBS on the application's JobQueue.
+    Every instance schedules the jobs, but they only run on the lease holder,
+    so a standby takes over within one lease TTL if the leader dies.
     """
-    logger.debug("Scheduler not configured; returning None.")
-    return None
+    global _elector
+    register_default_jobs()
+    _elector = LeaderElector(LEASE_FILE)
+    _elector.start()
+
+    jobs = []
+    job_queue = getattr(app, "job_queue", None)
+    if job_queue is None:
+        if JOBS:
+            logger.warning("JobQueue unavailable (install python-telegram-bot[job-queue]); %d jobs not scheduled.", len(JOBS))
+    else:
+        for callback, interval, first, name, leader in JOBS:
+            job_callback = leader_only(callback) if leader else callback
+            jobs.append(job_queue.run_repeating(job_callback, interval=interval, first=first, name=name))
+            logger.debug("Scheduled job %s every %ss", name, interval)
+    return SchedulerHandle(_elector, jobs)
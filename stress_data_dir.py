@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Check that several bot processes can share one DATA_DIR: file locks must
+not lose updates, and exactly one process may hold the scheduler lease.
+
+    python stress_data_dir.py [processes] [increments]
+
+Runs against a temporary DATA_DIR and exits non-zero on the first failure.
+  1. Every process increments a counter and appends to a list through
+     update_json; nothing may be lost or duplicated.
+  2. Every process runs a LeaderElector; there must be one leader at a
+     time, a killed leader must be replaced within one lease TTL, and a
+     cleanly stopped leader must be replaced at once.
+"""
+import os
+import sys
+import time
+import queue
+import signal
+import tempfile
+import multiprocessing as mp
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="churchbot-stress-"))
+
+from utils.json_utils import load_json, update_json
+from utils.lock_utils import LeaderElector
+
+DATA_DIR = os.environ["DATA_DIR"]
+COUNTER_FILE = os.path.join(DATA_DIR, "stress_counter.json")
+LEASE_FILE = os.path.join(DATA_DIR, "stress_lease.json")
+LEASE_TTL = 1.0
+POLL = 0.02
+
+
+def _increment(worker: int, increments: int) -> None:
+    for i in range(increments):
+        def mutate(state) -> bool:
+            state["count"] = state.get("count", 0) + 1
+            state.setdefault("seen", []).append(f"{worker}:{i}")
+            return True
+
+        update_json(COUNTER_FILE, mutate, {})
+
+
+def _elect(worker: int, events) -> None:
+    elector = LeaderElector(LEASE_FILE, ttl=LEASE_TTL, instance_id=f"worker-{worker}")
+    signal.signal(signal.SIGTERM, lambda *_: (elector.stop(), events.put((worker, False)), sys.exit(0)))
+    elector.start()
+    leading = False
+    while True:
+        if elector.is_leader != leading:
+            leading = elector.is_leader
+            events.put((worker, leading))
+        time.sleep(POLL)
+
+
+def check_counter(processes: int, increments: int) -> None:
+    workers = [mp.Process(target=_increment, args=(w, increments)) for w in range(processes)]
+    start = time.perf_counter()
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    elapsed = time.perf_counter() - start
+    state = load_json(COUNTER_FILE, {})
+    expected = processes * increments
+    seen = state.get("seen", [])
+    assert state.get("count") == expected, f"counter is {state.get('count')}, expected {expected}"
+    assert len(seen) == len(set(seen)) == expected, "list lost or duplicated entries"
+    print(f"OK    {expected} locked updates from {processes} processes in {elapsed:.2f}s")
+
+
+class _Leaders:
+    """Leadership as reported by the workers; fails if two ever overlap."""
+
+    def __init__(self, events):
+        self.events = events
+        self.current = set()
+
+    def _next(self):
+        try:
+            worker, leading = self.events.get(timeout=POLL)
+        except queue.Empty:
+            return None
+        if leading:
+            self.current.add(worker)
+        else:
+            self.current.discard(worker)
+        assert len(self.current) <= 1, f"workers {sorted(self.current)} lead at the same time"
+        return worker if leading else None
+
+    def wait_for_new(self, exclude, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            worker = self._next()
+            if worker is not None and worker not in exclude:
+                return worker
+        raise AssertionError(f"no new leader within {timeout:.1f}s")
+
+    def watch(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._next()
+        assert len(self.current) == 1, f"{len(self.current)} leaders after {seconds:.1f}s"
+
+
+def check_lease(processes: int) -> None:
+    events = mp.Queue()
+    workers = {w: mp.Process(target=_elect, args=(w, events)) for w in range(processes)}
+    for p in workers.values():
+        p.start()
+    leaders = _Leaders(events)
+    try:
+        first = leaders.wait_for_new(set(), LEASE_TTL * 5)
+
+        # A crashed leader never releases; a standby waits for the lease to expire.
+        killed_at = time.monotonic()
+        os.kill(workers[first].pid, signal.SIGKILL)
+        workers[first].join()
+        leaders.current.discard(first)
+        second = leaders.wait_for_new({first}, LEASE_TTL * 3)
+        takeover = time.monotonic() - killed_at
+        assert takeover <= LEASE_TTL + LEASE_TTL / 3 + 0.5, f"takeover after a crash took {takeover:.2f}s"
+        print(f"OK    crashed leader replaced in {takeover:.2f}s (lease TTL {LEASE_TTL:.1f}s)")
+
+        # A clean shutdown releases the lease, so a standby takes over at its next renewal.
+        stopped_at = time.monotonic()
+        workers[second].terminate()
+        workers[second].join()
+        third = leaders.wait_for_new({first, second}, LEASE_TTL * 3)
+        takeover = time.monotonic() - stopped_at
+        assert takeover < LEASE_TTL, f"takeover after a clean stop took {takeover:.2f}s"
+        print(f"OK    stopped leader replaced in {takeover:.2f}s by worker {third}")
+
+        # The remaining workers keep a single leader.
+        leaders.watch(LEASE_TTL * 3)
+        print(f"OK    one leader among {processes - 2} remaining processes")
+    finally:
+        for p in workers.values():
+            if p.is_alive():
+                p.kill()
+                p.join()
+
+
+def main(argv) -> int:
+    processes = int(argv[1]) if len(argv) > 1 else 8
+    increments = int(argv[2]) if len(argv) > 2 else 200
+    if processes < 3:
+        print("error: need at least 3 processes", file=sys.stderr)
+        return 2
+    print(f"DATA_DIR={DATA_DIR}")
+    try:
+        check_counter(processes, increments)
+        check_lease(processes)
+    except AssertionError as e:
+        print(f"FAIL  {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,248 @@
+# supervisor.py
+import os
+import time
+import random
+import signal
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.error import InvalidToken, NetworkError, TelegramError
+from telegram.ext import ContextTypes
+
+import config
+from utils.json_utils import load_json, save_json
+
+logger = logging.getLogger("ChurchBot.supervisor")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+STATE_FILE = os.path.join(DATA_DIR, "polling_state.json")
+
+BACKOFF_BASE = float(config.BOT_BACKOFF_SECONDS)
+BACKOFF_MAX = float(config.BOT_BACKOFF_MAX_SECONDS)
+CHECK_INTERVAL = config.SUPERVISOR_CHECK_INTERVAL
+STATE_SAVE_INTERVAL = config.SUPERVISOR_STATE_SAVE_INTERVAL
+# Update IDs are sequential only while updates keep coming: after a week
+# without any, Telegram picks the next ID at random. Resume from a stored
+# ID only if it is younger than this.
+RESUME_MAX_AGE = 6 * 24 * 3600
+
+
+class Backoff:
+    """Exponential backoff with full jitter and no attempt limit."""
+
+    def __init__(self, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = random.uniform(0, min(self.cap, self.base * (2 ** self.attempt)))
+        self.attempt += 1
+        return delay
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+
+class PollingMonitor:
+    """
+    Tracks the last processed update ID (so a restart resumes instead of
+    dropping pending updates) and outage metrics, persisted to
+    polling_state.json.
+    """
+
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self.state = load_json(path, {}) or {}
+        self.state.setdefault("last_update_id", None)
+        self.state.setdefault("outages", 0)
+        self.state.setdefault("total_outage_seconds", 0.0)
+        self.outage_started: Optional[float] = None
+        self._dirty = False
+        self._saved_at = 0.0
+
+    @property
+    def in_outage(self) -> bool:
+        return self.outage_started is not None
+
+    def mark_processed(self, update_id: int) -> None:
+        # Stored as-is, not as a maximum: a randomly restarted ID may be lower.
+        self.state["last_update_id"] = update_id
+        self.state["last_update_at"] = time.time()
+        self._dirty = True
+
+    def on_error(self, error: TelegramError) -> None:
+        """Polling error callback; a network error opens an outage."""
+        if not isinstance(error, NetworkError):
+            # e.g. Conflict: another instance is polling with the same token.
+            logger.error("Polling error: %s", error)
+        elif self.outage_started is None:
+            self.outage_started = time.monotonic()
+            self.state["last_outage_started_at"] = time.time()
+            logger.warning("Telegram unreachable; outage started: %s", error)
+        else:
+            logger.debug("Still unreachable: %s", error)
+
+    def recovered(self, reconnect_started: Optional[float] = None) -> None:
+        """Close the current outage and record its duration and recovery time."""
+        if self.outage_started is None:
+            return
+        now = time.monotonic()
+        duration = now - self.outage_started
+        self.state["outages"] += 1
+        self.state["total_outage_seconds"] += duration
+        self.state["last_outage_seconds"] = round(duration, 3)
+        if reconnect_started is not None:
+            self.state["last_recovery_seconds"] = round(now - reconnect_started, 3)
+        self.state["last_recovered_at"] = time.time()
+        self.outage_started = None
+        self._dirty = True
+        logger.info(
+            "Telegram reachable again after %.1fs outage (recovery %.1fs).",
+            duration, self.state.get("last_recovery_seconds", 0.0),
+        )
+        self.save(force=True)
+
+    def save(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if self._dirty and (force or now - self._saved_at >= STATE_SAVE_INTERVAL):
+            save_json(self.path, self.state)
+            self._dirty = False
+            self._saved_at = now
+
+
+monitor = PollingMonitor()
+
+
+async def track_processed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Last handler group: remember how far processing got."""
+    if isinstance(update, Update):
+        monitor.mark_processed(update.update_id)
+
+
+async def _sleep_unless_stopped(stop: asyncio.Event, delay: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _retry_forever(what: str, func, stop: asyncio.Event) -> bool:
+    """Call func() until it succeeds or stop is set; returns False if stopped."""
+    backoff = Backoff()
+    started = time.monotonic()
+    while not stop.is_set():
+        try:
+            await func()
+            if monitor.in_outage:
+                monitor.recovered(started)
+            return True
+        except InvalidToken:
+            raise
+        except (NetworkError, OSError) as e:
+            if isinstance(e, NetworkError):
+                monitor.on_error(e)
+            delay = backoff.next_delay()
+            logger.warning("%s failed (%s); retrying in %.1fs", what, e, delay)
+            await _sleep_unless_stopped(stop, delay)
+    return False
+
+
+async def _acknowledge_processed(app) -> None:
+    """
+    Confirm updates processed before the last shutdown, leaving the rest
+    pending; getUpdates with offset N acknowledges everything below N.
+    """
+    last = monitor.state.get("last_update_id")
+    if last is None:
+        return
+    if time.time() - monitor.state.get("last_update_at", 0) > RESUME_MAX_AGE:
+        # Pending updates may carry lower, randomly restarted IDs; acknowledging
+        # from `last` would drop them all. Keep everything pending instead.
+        logger.info("Last processed update %s is too old to resume from; keeping all pending updates.", last)
+        return
+    try:
+        await app.bot.get_updates(offset=last + 1, limit=1, timeout=0)
+        logger.info("Resuming after update %s.", last)
+    except NetworkError:
+        raise
+    except TelegramError as e:
+        # e.g. Conflict while a webhook is still set; start_polling clears it.
+        logger.warning("Could not acknowledge processed updates: %s", e)
+
+
+async def supervise(app, allowed_updates=Update.ALL_TYPES) -> None:
+    """
+    Run the application until SIGINT/SIGTERM. Bootstrap and polling failures
+    are retried with jittered exponential backoff and no attempt cap. The
+    Application (and so its JobQueue) stays started while only the updater
+    is restarted, and pending updates are never dropped.
+
+    PTB's own getUpdates retry has no jitter, so when polling hits a network
+    error the updater is stopped and reconnection is probed here, with the
+    same jittered backoff; polling restarts once Telegram answers again.
+    """
+    stop = asyncio.Event()
+    # Set on shutdown signals and on the first polling network error.
+    wake = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def request_stop() -> None:
+        stop.set()
+        wake.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, request_stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # e.g. Windows; KeyboardInterrupt still ends asyncio.run
+
+    def on_polling_error(error: TelegramError) -> None:
+        monitor.on_error(error)
+        if monitor.in_outage:
+            wake.set()
+
+    if not await _retry_forever("Bot initialization", app.initialize, stop):
+        return
+    try:
+        await _retry_forever("Offset resume", lambda: _acknowledge_processed(app), stop)
+        await app.start()
+
+        async def start_polling():
+            await app.updater.start_polling(
+                allowed_updates=allowed_updates,
+                drop_pending_updates=False,
+                bootstrap_retries=0,
+                error_callback=on_polling_error,
+            )
+
+        while not stop.is_set():
+            if monitor.in_outage:
+                if app.updater.running:
+                    await app.updater.stop()
+                    logger.info("Polling paused until Telegram is reachable again.")
+                monitor.save()
+                if not await _retry_forever("Reconnect probe", app.bot.get_me, stop):
+                    break
+            if not app.updater.running:
+                if not await _retry_forever("Polling start", start_polling, stop):
+                    break
+                logger.info("Polling started.")
+            monitor.save()
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        logger.info("Stopping bot.")
+        try:
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+        finally:
+            await app.shutdown()
+            monitor.save(force=True)
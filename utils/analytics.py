@@ -0,0 +1,409 @@
+# utils/analytics.py
+import os
+import math
+import time
+import asyncio
+import base64
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import config
+from .json_utils import load_json, update_json
+from .flood_control import command_of
+from .router import callback_namespace
+
+logger = logging.getLogger("ChurchBot.analytics")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+ANALYTICS_FILE = os.path.join(DATA_DIR, "analytics.json")
+
+# 2**precision registers per counter: 10 -> 1 KiB, ~3.3% standard error.
+HLL_PRECISION = config.ANALYTICS_HLL_PRECISION
+RETENTION_DAYS = config.ANALYTICS_RETENTION_DAYS
+MAX_GROUPS = config.ANALYTICS_MAX_GROUPS
+MAX_COMMANDS = 64
+FLUSH_INTERVAL = config.ANALYTICS_FLUSH_INTERVAL
+# Keys of the rings stored in analytics.json, next to "groups".
+HLL_RINGS = ("active", "quiz_players")
+COUNTER_RINGS = ("commands", "quiz_starts")
+
+
+class HyperLogLog:
+    """Fixed-size distinct counter (Flajolet et al.), 2**p one-byte registers."""
+
+    def __init__(self, p: int = HLL_PRECISION, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, item) -> None:
+        x = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - self.p)
+        rest = (x << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.p + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+    def encode(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def decode(cls, data: str, p: int = HLL_PRECISION) -> "HyperLogLog":
+        registers = bytearray(base64.b64decode(data))
+        if len(registers) != 1 << p:
+            return cls(p)
+        return cls(p, registers)
+
+
+def today() -> int:
+    return int(time.time() // 86400)
+
+
+class DayRing:
+    """
+    One value per day for the last RETENTION_DAYS days in a fixed slot
+    array; writing to a new day recycles the slot of the oldest one.
+    """
+
+    def __init__(self, factory, days: int = RETENTION_DAYS):
+        self.factory = factory
+        self.days = days
+        self.slots: List[Optional[list]] = [None] * days  # [day, value]
+
+    def get(self, day: int, create: bool = True):
+        slot = self.slots[day % self.days]
+        if slot is not None and slot[0] == day:
+            return slot[1]
+        if not create:
+            return None
+        value = self.factory()
+        self.slots[day % self.days] = [day, value]
+        return value
+
+    def items(self, last_days: int, end_day: int) -> Iterable:
+        for day in range(end_day - last_days + 1, end_day + 1):
+            value = self.get(day, create=False)
+            if value is not None:
+                yield day, value
+
+
+class Analytics:
+    """
+    Bounded-memory activity rollups: daily distinct users (overall and per
+    group), command counts, and quiz participation. Memory depends only on
+    RETENTION_DAYS, HLL_PRECISION and MAX_GROUPS, not on the user count.
+    """
+
+    def __init__(self, path: str = ANALYTICS_FILE):
+        self.path = path
+        self.active = DayRing(HyperLogLog)
+        self.groups: "OrderedDict[str, DayRing]" = OrderedDict()
+        self.commands = DayRing(Counter)
+        self.quiz_players = DayRing(HyperLogLog)
+        self.quiz_starts = DayRing(Counter)
+        # Counter increments not yet added to the file (HLLs merge idempotently, counters do not).
+        self.pending_commands = DayRing(Counter)
+        self.pending_quiz_starts = DayRing(Counter)
+        self.dirty = False
+        self._loaded = False
+        # (ring key, day) of HLLs changed since the last flush; see _hll_ring().
+        self._touched = set()
+        self._flush_lock = asyncio.Lock()
+
+    def _group_ring(self, chat_id: str) -> DayRing:
+        ring = self.groups.get(chat_id)
+        if ring is None:
+            ring = self.groups[chat_id] = DayRing(HyperLogLog)
+            while len(self.groups) > MAX_GROUPS:
+                self.groups.popitem(last=False)
+        else:
+            self.groups.move_to_end(chat_id)
+        return ring
+
+    def record(self, user_id: int, chat_id: Optional[int], chat_type: Optional[str],
+               command: Optional[str], quiz_answer: bool = False, day: Optional[int] = None) -> None:
+        self.load()
+        day = today() if day is None else day
+        self.active.get(day).add(user_id)
+        self._touched.add(("active", day))
+        if chat_id is not None and chat_type in ("group", "supergroup"):
+            self._group_ring(str(chat_id)).get(day).add(user_id)
+            self._touched.add((str(chat_id), day))
+        if command:
+            counts = self.commands.get(day)
+            if command not in counts and len(counts) >= MAX_COMMANDS:
+                command = "other"
+            counts[command] += 1
+            self.pending_commands.get(day)[command] += 1
+        if command == "quiz":
+            self.quiz_starts.get(day)["starts"] += 1
+            self.pending_quiz_starts.get(day)["starts"] += 1
+        if command == "quiz" or quiz_answer:
+            self.quiz_players.get(day).add(user_id)
+            self._touched.add(("quiz_players", day))
+        self.dirty = True
+
+    # --- queries ---
+    def distinct(self, ring: DayRing, days: int, end_day: Optional[int] = None) -> int:
+        end_day = today() if end_day is None else end_day
+        merged = HyperLogLog()
+        for _, hll in ring.items(days, end_day):
+            merged.merge(hll)
+        return merged.count()
+
+    def daily_series(self, ring: DayRing, days: int, end_day: Optional[int] = None) -> List[int]:
+        end_day = today() if end_day is None else end_day
+        series = []
+        for day in range(end_day - days + 1, end_day + 1):
+            hll = ring.get(day, create=False)
+            series.append(hll.count() if hll is not None else 0)
+        return series
+
+    def command_totals(self, days: int, end_day: Optional[int] = None) -> Counter:
+        end_day = today() if end_day is None else end_day
+        total = Counter()
+        for _, counts in self.commands.items(days, end_day):
+            total.update(dict(counts))  # copy first: record() may add keys meanwhile
+        return total
+
+    # --- persistence ---
+    # Several instances may share DATA_DIR, so flush merges into the file
+    # (HLL registers by max, counters by adding pending increments) and
+    # then adopts the merged result, which includes the other instances.
+    # Only the snapshot and the adopt step run on the event loop; the file is
+    # read, merged and written in a worker thread.
+
+    def _hll_rings(self) -> Dict[str, DayRing]:
+        return {"active": self.active, "quiz_players": self.quiz_players}
+
+    def _counter_rings(self) -> Dict[str, tuple]:
+        return {
+            "commands": (self.commands, self.pending_commands),
+            "quiz_starts": (self.quiz_starts, self.pending_quiz_starts),
+        }
+
+    def _hll_ring(self, key: str) -> Optional[DayRing]:
+        """Ring for a key in `_touched`: a name from _hll_rings() or a group chat ID."""
+        ring = self._hll_rings().get(key)
+        return ring if ring is not None else self.groups.get(key)
+
+    def _snapshot(self) -> Dict:
+        """
+        Copy the HLLs touched since the last flush and take the pending
+        counter increments. HLLs merge idempotently, so untouched ones are
+        already in the file.
+        """
+        hlls = {}
+        for key, day in self._touched:
+            ring = self._hll_ring(key)
+            hll = ring.get(day, create=False) if ring is not None else None
+            if hll is not None:
+                hlls.setdefault(key, {})[day] = bytes(hll.registers)
+        pending = {}
+        for name, (_, ring) in self._counter_rings().items():
+            pending[name] = [slot for slot in ring.slots if slot is not None]
+            ring.slots = [None] * ring.days
+        self._touched = set()
+        self.dirty = False
+        return {"hlls": hlls, "pending": pending}
+
+    def _restore(self, snapshot: Dict) -> None:
+        """Put a snapshot back after a failed write, so the next flush retries it."""
+        for key, days in snapshot["hlls"].items():
+            self._touched.update((key, day) for day in days)
+        for name, (_, ring) in self._counter_rings().items():
+            for day, counts in snapshot["pending"][name]:
+                ring.get(day).update(counts)
+        self.dirty = True
+
+    def _install(self, decoded: Dict) -> None:
+        """Adopt decoded file contents, keeping what was recorded since the snapshot."""
+        recent = {}
+        for key, day in self._touched:
+            ring = self._hll_ring(key)
+            hll = ring.get(day, create=False) if ring is not None else None
+            if hll is not None:
+                recent[key, day] = hll
+        for name, ring in self._hll_rings().items():
+            ring.slots = decoded["hlls"][name]
+        for chat_id, slots in decoded["groups"].items():
+            self._group_ring(chat_id).slots = slots
+        for name, (ring, pending) in self._counter_rings().items():
+            ring.slots = decoded["counters"][name]
+            for slot in pending.slots:
+                if slot is not None:
+                    ring.get(slot[0]).update(slot[1])
+        for (key, day), hll in recent.items():
+            ring = self._hll_ring(key)
+            if ring is not None and ring.get(day) is not hll:
+                ring.get(day).merge(hll)
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        data = load_json(self.path, {})
+        if data and data.get("p") == HLL_PRECISION:
+            self._install(_decode(data))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            self.load()
+            snapshot = self._snapshot()
+            try:
+                decoded = await asyncio.to_thread(_write_merged, self.path, snapshot)
+            except Exception:
+                self._restore(snapshot)
+                raise
+            self._install(decoded)
+
+
+def _merge_snapshot(data: Dict, snapshot: Dict) -> None:
+    if data.get("p") != HLL_PRECISION:
+        data.clear()
+        data["p"] = HLL_PRECISION
+    oldest = today() - RETENTION_DAYS + 1
+    groups = data.setdefault("groups", {})
+    for key, days in snapshot["hlls"].items():
+        stored = data.setdefault(key, {}) if key in HLL_RINGS else groups.setdefault(key, {})
+        for day, registers in days.items():
+            hll = HyperLogLog(registers=bytearray(registers))
+            if str(day) in stored:
+                hll.merge(HyperLogLog.decode(stored[str(day)]))
+            stored[str(day)] = hll.encode()
+    for name in HLL_RINGS:
+        data[name] = {day: value for day, value in data.get(name, {}).items() if int(day) >= oldest}
+    for chat_id in list(groups):
+        groups[chat_id] = {day: v for day, v in groups[chat_id].items() if int(day) >= oldest}
+        if not groups[chat_id]:
+            del groups[chat_id]
+    for name in COUNTER_RINGS:
+        days = data.get(name, {})
+        for day, counts in snapshot["pending"][name]:
+            total = Counter(days.get(str(day), {}))
+            total.update(counts)
+            days[str(day)] = dict(total)
+        data[name] = {day: value for day, value in days.items() if int(day) >= oldest}
+
+
+def _decode(data: Dict) -> Dict:
+    """File contents as ring slot lists, ready to install."""
+    oldest = today() - RETENTION_DAYS + 1
+
+    def slots(days: Optional[Dict], decode) -> List[Optional[list]]:
+        out = [None] * RETENTION_DAYS
+        for day, value in (days or {}).items():
+            if int(day) >= oldest:
+                out[int(day) % RETENTION_DAYS] = [int(day), decode(value)]
+        return out
+
+    return {
+        "hlls": {name: slots(data.get(name), HyperLogLog.decode) for name in HLL_RINGS},
+        "counters": {name: slots(data.get(name), Counter) for name in COUNTER_RINGS},
+        "groups": {chat_id: slots(days, HyperLogLog.decode) for chat_id, days in data.get("groups", {}).items()},
+    }
+
+
+def _write_merged(path: str, snapshot: Dict) -> Dict:
+    """Worker thread: merge a snapshot into the file and decode the result."""
+    merged = {}
+
+    def merge(data) -> bool:
+        _merge_snapshot(data, snapshot)
+        merged.update(data)
+        return True
+
+    update_json(path, merge, {})
+    return _decode(merged)
+
+
+analytics = Analytics()
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Update-stream tap; registered after flood control so dropped updates are not counted."""
+    user = update.effective_user
+    if user is None or user.is_bot:
+        return
+    chat = update.effective_chat
+    try:
+        analytics.record(
+            user.id,
+            chat.id if chat else None,
+            chat.type if chat else None,
+            command_of(update),
+            quiz_answer=callback_namespace(update) == "quiz",
+        )
+    except Exception:
+        logger.exception("Failed to record analytics for update %s", update.update_id)
+
+
+async def flush_job(context) -> None:
+    """Persist rollups. Runs on every instance, since each counts its own updates."""
+    if analytics.dirty:
+        await analytics.flush()
+
+
+async def build_report(group_id: Optional[str] = None, days: int = 7) -> str:
+    """Flush (which also pulls in other instances' counts), then render in a worker thread."""
+    await analytics.flush()
+    return await asyncio.to_thread(render_report, group_id, days)
+
+
+def render_report(group_id: Optional[str] = None, days: int = 7) -> str:
+    """Read-only; safe in a worker thread while the loop keeps recording."""
+    spark = "▁▂▃▄▅▆▇█"
+
+    def sparkline(series: List[int]) -> str:
+        top = max(series) or 1
+        return "".join(spark[min(len(spark) - 1, value * (len(spark) - 1) // top)] for value in series)
+
+    if group_id is not None:
+        ring = analytics.groups.get(str(group_id))
+        if ring is None:
+            return f"No activity recorded for group {group_id}."
+        series = analytics.daily_series(ring, days)
+        return (
+            f"📊 Group {group_id}\n"
+            f"DAU today: {series[-1]}\n"
+            f"WAU: {analytics.distinct(ring, 7)}\n"
+            f"Last {days} days: {sparkline(series)} {series}"
+        )
+
+    series = analytics.daily_series(analytics.active, days)
+    lines = [
+        "📊 Community activity",
+        f"DAU today: {series[-1]}",
+        f"WAU: {analytics.distinct(analytics.active, 7)}",
+        f"MAU: {analytics.distinct(analytics.active, min(30, RETENTION_DAYS))}",
+        f"Last {days} days: {sparkline(series)} {series}",
+        "",
+        f"🎯 Quiz players ({days}d): {analytics.distinct(analytics.quiz_players, days)}",
+        f"🎯 Quizzes started ({days}d): {sum(c['starts'] for _, c in analytics.quiz_starts.items(days, today()))}",
+    ]
+    top = analytics.command_totals(days).most_common(8)
+    if top:
+        lines += ["", f"⌨️ Top commands ({days}d):"] + [f"/{name}: {count}" for name, count in top]
+    busiest = sorted(
+        ((analytics.distinct(ring, 7), chat_id) for chat_id, ring in list(analytics.groups.items())), reverse=True
+    )[:5]
+    if busiest:
+        lines += ["", "👥 Most active groups (WAU):"] + [f"{chat_id}: {wau}" for wau, chat_id in busiest]
+    return "\n".join(lines)
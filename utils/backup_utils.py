@@ -0,0 +1,299 @@
+# utils/backup_utils.py
+import os
+import asyncio
+import gzip
+import glob
+import hashlib
+import logging
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import config
+from .json_utils import load_json, loads, save_json
+from .lock_utils import file_lock
+
+logger = logging.getLogger("ChurchBot.backup_utils")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SNAPSHOT_DIR = config.SNAPSHOT_DIR
+SNAPSHOT_INTERVAL = config.SNAPSHOT_INTERVAL
+SNAPSHOT_KEEP_LAST = config.SNAPSHOT_KEEP_LAST
+SNAPSHOT_KEEP_DAILY = config.SNAPSHOT_KEEP_DAILY
+
+CHUNK_SIZE = 64 * 1024
+# IDs sort chronologically; a second snapshot within the same second gets a
+# "-01", "-02"... suffix instead of overwriting the first one's manifest.
+ID_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# Runtime state that should never be rolled back.
+EXCLUDED = {"scheduler_lease.json"}
+
+
+def _objects_dir(snapshot_dir: str) -> str:
+    return os.path.join(snapshot_dir, "objects")
+
+
+def _manifests_dir(snapshot_dir: str) -> str:
+    return os.path.join(snapshot_dir, "manifests")
+
+
+def _object_path(snapshot_dir: str, digest: str) -> str:
+    return os.path.join(_objects_dir(snapshot_dir), digest + ".json.gz")
+
+
+def _datasets(data_dir: str) -> List[str]:
+    return sorted(
+        os.path.basename(p) for p in glob.glob(os.path.join(data_dir, "*.json"))
+        if os.path.basename(p) not in EXCLUDED
+    )
+
+
+def list_snapshots(snapshot_dir: str = SNAPSHOT_DIR) -> List[str]:
+    """Snapshot IDs, oldest first."""
+    return sorted(
+        os.path.basename(p)[:-len(".json")]
+        for p in glob.glob(os.path.join(_manifests_dir(snapshot_dir), "*.json"))
+    )
+
+
+def _manifest_path(snapshot_id: str, snapshot_dir: str) -> str:
+    return os.path.join(_manifests_dir(snapshot_dir), snapshot_id + ".json")
+
+
+def load_manifest(snapshot_id: str, snapshot_dir: str = SNAPSHOT_DIR) -> Dict:
+    return load_json(_manifest_path(snapshot_id, snapshot_dir), {})
+
+
+def _new_snapshot_id(now: datetime, snapshot_dir: str) -> str:
+    """An ID that sorts after every existing one, including any from the same second."""
+    base = now.strftime(ID_FORMAT)
+    same_second = [i for i in list_snapshots(snapshot_dir) if i.startswith(base)]
+    if not same_second:
+        return base
+    last = max(same_second)
+    n = int(last[len(base) + 1:] or 0) + 1
+    return f"{base}-{n:02d}"
+
+
+def _store_object(src_path: str, snapshot_dir: str) -> Optional[str]:
+    """
+    Stream src_path through sha256 and gzip in CHUNK_SIZE pieces and return
+    its digest. The compressed object is kept only if it is new.
+    """
+    os.makedirs(_objects_dir(snapshot_dir), exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=_objects_dir(snapshot_dir))
+    try:
+        with open(src_path, "rb") as src, os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                gz.write(chunk)
+        target = _object_path(snapshot_dir, digest.hexdigest())
+        if os.path.exists(target):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, target)
+        return digest.hexdigest()
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _is_valid_json(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            loads(f.read())
+        return True
+    except Exception:
+        return False
+
+
+def take_snapshot(data_dir: str = DATA_DIR, snapshot_dir: str = SNAPSHOT_DIR,
+                  pinned: Iterable[str] = ()) -> Optional[str]:
+    """
+    Record an incremental snapshot. Datasets whose size and mtime match the
+    previous manifest are carried over without being read; changed ones are
+    hashed and compressed, and stored only if the content hash is new.
+    Corrupt datasets keep their last good entry. Retention then runs, never
+    removing the `pinned` snapshot IDs. Returns the snapshot ID, or None
+    when nothing changed since the previous snapshot.
+    """
+    # One snapshot at a time, across processes: retention must not delete
+    # an object another snapshot has just found already stored.
+    with file_lock(os.path.join(snapshot_dir, "snapshot")):
+        return _take_snapshot(data_dir, snapshot_dir, pinned)
+
+
+def _take_snapshot(data_dir: str, snapshot_dir: str, pinned: Iterable[str]) -> Optional[str]:
+    previous_ids = list_snapshots(snapshot_dir)
+    previous = load_manifest(previous_ids[-1], snapshot_dir).get("datasets", {}) if previous_ids else {}
+
+    datasets = {}
+    stored = 0
+    for name in _datasets(data_dir):
+        path = os.path.join(data_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        old = previous.get(name)
+        if old and old.get("size") == st.st_size and old.get("mtime") == st.st_mtime:
+            datasets[name] = old
+            continue
+        if not _is_valid_json(path):
+            logger.warning("Skipping corrupt dataset %s in snapshot; keeping previous copy.", name)
+            if old:
+                datasets[name] = old
+            continue
+        digest = _store_object(path, snapshot_dir)
+        if not old or old.get("sha256") != digest:
+            stored += 1
+        datasets[name] = {"sha256": digest, "size": st.st_size, "mtime": st.st_mtime}
+
+    if previous_ids and datasets == previous:
+        logger.debug("No dataset changed since snapshot %s.", previous_ids[-1])
+        return None
+
+    now = datetime.now(timezone.utc)
+    os.makedirs(_manifests_dir(snapshot_dir), exist_ok=True)
+    snapshot_id = _new_snapshot_id(now, snapshot_dir)
+    save_json(
+        _manifest_path(snapshot_id, snapshot_dir),
+        {"id": snapshot_id, "created": now.timestamp(), "datasets": datasets},
+    )
+    logger.info("Snapshot %s taken (%d of %d datasets changed).", snapshot_id, stored, len(datasets))
+    apply_retention(snapshot_dir, pinned=pinned)
+    return snapshot_id
+
+
+def apply_retention(snapshot_dir: str = SNAPSHOT_DIR, keep_last: int = SNAPSHOT_KEEP_LAST,
+                    keep_daily: int = SNAPSHOT_KEEP_DAILY, pinned: Iterable[str] = ()) -> int:
+    """
+    Keep the newest `keep_last` snapshots plus the newest snapshot of each
+    of the last `keep_daily` days (and any `pinned` ones), then delete
+    objects no manifest uses. Returns the number of manifests removed.
+    """
+    ids = list_snapshots(snapshot_dir)
+    keep = set(ids[-keep_last:]) if keep_last > 0 else set()
+    keep.update(i for i in pinned if i in ids)
+    days = {}
+    for snapshot_id in ids:
+        days[snapshot_id[:8]] = snapshot_id  # newest of each day wins
+    keep.update(sorted(days.values())[-keep_daily:] if keep_daily > 0 else [])
+
+    removed = 0
+    for snapshot_id in ids:
+        if snapshot_id not in keep:
+            os.unlink(_manifest_path(snapshot_id, snapshot_dir))
+            removed += 1
+
+    referenced = set()
+    for snapshot_id in keep:
+        for entry in load_manifest(snapshot_id, snapshot_dir).get("datasets", {}).values():
+            referenced.add(entry.get("sha256"))
+    for path in glob.glob(os.path.join(_objects_dir(snapshot_dir), "*.json.gz")):
+        if os.path.basename(path)[:-len(".json.gz")] not in referenced:
+            os.unlink(path)
+    if removed:
+        logger.info("Retention removed %d snapshots.", removed)
+    return removed
+
+
+def parse_point_in_time(value: str) -> datetime:
+    """Accept a snapshot ID (20261019T150000Z) or an ISO date/time, read as UTC."""
+    value = value.strip()
+    try:
+        return datetime.strptime(value, ID_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def snapshot_at(moment: Optional[datetime] = None, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Newest snapshot taken at or before `moment` (latest if None)."""
+    ids = list_snapshots(snapshot_dir)
+    if moment is not None:
+        cutoff = moment.astimezone(timezone.utc).strftime(ID_FORMAT)
+        ids = [i for i in ids if i[:len(cutoff)] <= cutoff]
+    return ids[-1] if ids else None
+
+
+def find_snapshot(value: str, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """
+    Resolve `latest`, an exact snapshot ID or a point in time to a snapshot
+    ID. Raises ValueError if `value` is none of these.
+    """
+    if value.strip().lower() == "latest":
+        return snapshot_at(None, snapshot_dir)
+    if value.strip() in list_snapshots(snapshot_dir):
+        return value.strip()
+    return snapshot_at(parse_point_in_time(value), snapshot_dir)
+
+
+def _restore_object(digest: str, target: str, snapshot_dir: str) -> None:
+    """Stream-decompress an object over `target` atomically, under its dataset lock."""
+    dirpath = os.path.dirname(target) or "."
+    with file_lock(target):
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=dirpath)
+        try:
+            with gzip.open(_object_path(snapshot_dir, digest), "rb") as src, os.fdopen(fd, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def restore(snapshot_id: str, dataset: Optional[str] = None,
+            data_dir: str = DATA_DIR, snapshot_dir: str = SNAPSHOT_DIR) -> List[str]:
+    """
+    Restore every dataset (or just `dataset`) from a snapshot. Returns the
+    names restored. Raises FileNotFoundError if the snapshot does not exist.
+    """
+    if not os.path.exists(_manifest_path(snapshot_id, snapshot_dir)):
+        raise FileNotFoundError(f"Snapshot {snapshot_id} does not exist")
+    datasets = load_manifest(snapshot_id, snapshot_dir).get("datasets", {})
+    if dataset is not None:
+        if not dataset.endswith(".json"):
+            dataset += ".json"
+        datasets = {dataset: datasets[dataset]} if dataset in datasets else {}
+    restored = []
+    for name, entry in sorted(datasets.items()):
+        _restore_object(entry["sha256"], os.path.join(data_dir, name), snapshot_dir)
+        restored.append(name)
+    logger.warning("Restored %s from snapshot %s.", ", ".join(restored) or "nothing", snapshot_id)
+    return restored
+
+
+def restore_latest_good(dataset: str, data_dir: str = DATA_DIR, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """
+    Restore one dataset from the newest snapshot that has a readable copy of
+    it. Returns the snapshot ID used, or None if no snapshot could help.
+    """
+    for snapshot_id in reversed(list_snapshots(snapshot_dir)):
+        entry = load_manifest(snapshot_id, snapshot_dir).get("datasets", {}).get(dataset)
+        if not entry or not os.path.exists(_object_path(snapshot_dir, entry["sha256"])):
+            continue
+        try:
+            _restore_object(entry["sha256"], os.path.join(data_dir, dataset), snapshot_dir)
+        except Exception:
+            logger.exception("Snapshot %s copy of %s is unreadable; trying an older one.", snapshot_id, dataset)
+            continue
+        return snapshot_id
+    return None
+
+
+async def snapshot_job(context) -> None:
+    """Scheduler job: take_snapshot in a worker thread so polling is not blocked."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, take_snapshot)
+    except Exception:
+        logger.exception("Scheduled snapshot failed.")
@@ -2,7 +2,7 @@
 import os
 import logging
 from typing import List
-from .json_utils import load_json, save_json
+from .json_utils import load_json, save_json, update_json
 from telegram import Update
 from telegram.ext import ContextTypes
 
@@ -13,25 +13,32 @@ ADMINS_FILE = os.path.join(DATA_DIR, "admins.json")
 GROUPS_FILE = os.path.join(DATA_DIR, "groups.json")
 PRAYERS_FILE = os.path.join(DATA_DIR, "prayers.json")
 EVENTS_FILE = os.path.join(DATA_DIR, "events.json")
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
 def get_admins() -> List[str]:
     return load_json(ADMINS_FILE, [])
 
+def _add_item(item):
+    def mutate(items) -> bool:
+        if item not in items:
+            items.append(item)
+            return True
+        return False
+    return mutate
+
+def _remove_item(item):
+    def mutate(items) -> bool:
+        if item in items:
+            items.remove(item)
+            return True
+        return False
+    return mutate
+
 def add_admin(user_id: str) -> bool:
-    admins = get_admins()
-    if str(user_id) not in admins:
-        admins.append(str(user_id))
-        save_json(ADMINS_FILE, admins)
-        return True
-    return False
+    return update_json(ADMINS_FILE, _add_item(str(user_id)), [])
 
 def remove_admin(user_id: str) -> bool:
-    admins = get_admins()
-    if str(user_id) in admins:
-        admins.remove(str(user_id))
-        save_json(ADMINS_FILE, admins)
-        return True
-    return False
+    return update_json(ADMINS_FILE, _remove_item(str(user_id)), [])
 
 def is_admin(user_id):
     admins = get_admins()  # returns list of strings
@@ -41,36 +48,25 @@ def get_groups():
     return load_json(GROUPS_FILE, [])
 
 def add_group(group_id: str) -> bool:
-    groups = get_groups()
-    if str(group_id) not in groups:
-        groups.append(str(group_id))
-        save_json(GROUPS_FILE, groups)
-        return True
-    return False
+    return update_json(GROUPS_FILE, _add_item(str(group_id)), [])
 
 def remove_group(group_id: str) -> bool:
-    groups = get_groups()
-    if str(group_id) in groups:
-        groups.remove(str(group_id))
-        save_json(GROUPS_FILE, groups)
-        return True
-    return False
+    return update_json(GROUPS_FILE, _remove_item(str(group_id)), [])
+
+def get_users():
+    return load_json(USERS_FILE, [])
 
 def get_prayers():
     return load_json(PRAYERS_FILE, [])
 
 def add_prayer(user_id: str, text: str) -> None:
-    prayers = get_prayers()
-    prayers.append({"user": str(user_id), "text": text})
-    save_json(PRAYERS_FILE, prayers)
+    update_json(PRAYERS_FILE, lambda prayers: prayers.append({"user": str(user_id), "text": text}) or True, [])
 
 def get_events():
     return load_json(EVENTS_FILE, [])
 
 def add_event(event: str) -> None:
-    events = get_events()
-    events.append(event)
-    save_json(EVENTS_FILE, events)
+    update_json(EVENTS_FILE, lambda events: events.append(event) or True, [])
 
 def clear_events() -> None:
     save_json(EVENTS_FILE, [])
@@ -0,0 +1,83 @@
+# utils/broadcast_utils.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, Tuple
+
+from telegram.error import ChatMigrated, RetryAfter
+
+import config
+from .chat_health import tracker, MESSAGE_ERRORS, MIGRATED
+
+logger = logging.getLogger("ChurchBot.broadcast_utils")
+
+# Telegram allows roughly 30 messages/second across different chats.
+BROADCAST_RATE_PER_SEC = config.BROADCAST_RATE_PER_SEC
+# A broadcast whose first recipients all reject the message with the same
+# error is aborted: the message is broken, not the chats.
+ABORT_AFTER = 3
+
+
+class BroadcastAborted(Exception):
+    """The message was rejected identically by every recipient tried so far."""
+
+    def __init__(self, error: Exception, attempts: int):
+        super().__init__(f"{error} (rejected by the first {attempts} recipients)")
+        self.error = error
+        self.attempts = attempts
+
+
+async def fan_out(
+    kind: str,
+    chat_ids: Iterable,
+    send: Callable[[int], Awaitable[object]],
+) -> Tuple[int, int]:
+    """
+    Call `send(chat_id)` for every recipient at BROADCAST_RATE_PER_SEC.
+
+    Outcomes feed the chat health tracker: dead recipients are pruned,
+    migrated groups are retried once under their new ID, and flood-control
+    responses are honoured before retrying. Returns (success, fail).
+    Raises BroadcastAborted if the first ABORT_AFTER recipients all reject
+    the message with the same error.
+    """
+    delay = 1.0 / BROADCAST_RATE_PER_SEC if BROADCAST_RATE_PER_SEC > 0 else 0
+    success, fail = 0, 0
+    rejected = []
+    try:
+        for chat_id in chat_ids:
+            try:
+                target = int(chat_id)
+            except (TypeError, ValueError):
+                # e.g. a name saved with /addgroup; one bad entry must not end the broadcast.
+                logger.warning("Broadcast to %s %r failed: not a numeric chat ID", kind, chat_id)
+                fail += 1
+                continue
+            for attempt in range(3):
+                try:
+                    await send(target)
+                    tracker.record_success(kind, target)
+                    success += 1
+                    break
+                except RetryAfter as e:
+                    logger.info("Flood control while broadcasting; sleeping %ss", e.retry_after)
+                    await asyncio.sleep(float(e.retry_after))
+                    if attempt == 2:
+                        tracker.record_failure(kind, target, e)
+                        fail += 1
+                except Exception as e:
+                    error_class = tracker.record_failure(kind, target, e)
+                    if error_class == MIGRATED and isinstance(e, ChatMigrated) and attempt < 2:
+                        target = int(e.new_chat_id)
+                        continue
+                    logger.warning("Broadcast to %s %s failed (%s): %s", kind, target, error_class, e)
+                    fail += 1
+                    if not success and error_class in MESSAGE_ERRORS and len(rejected) < ABORT_AFTER:
+                        rejected.append(str(e))
+                        if len(rejected) == ABORT_AFTER and len(set(rejected)) == 1:
+                            raise BroadcastAborted(e, ABORT_AFTER)
+                    break
+            if delay:
+                await asyncio.sleep(delay)
+    finally:
+        tracker.flush()
+    return success, fail
@@ -0,0 +1,224 @@
+# utils/chat_health.py
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import config
+from .json_utils import load_json, update_json
+from .bot_utils import GROUPS_FILE, USERS_FILE
+from .segments import segments
+
+logger = logging.getLogger("ChurchBot.chat_health")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+HEALTH_FILE = os.path.join(DATA_DIR, "chat_health.json")
+
+# Consecutive failures caused by the chat itself (e.g. the bot lost the right
+# to post) before a recipient is treated as dead.
+TRANSIENT_STRIKES = config.DEAD_CHAT_TRANSIENT_STRIKES
+# Chats not confirmed reachable for this long are re-validated by the sweeper.
+STALE_SECONDS = config.DEAD_CHAT_STALE_SECONDS
+SWEEP_INTERVAL = config.DEAD_CHAT_SWEEP_INTERVAL
+SWEEP_BATCH = config.DEAD_CHAT_SWEEP_BATCH
+SWEEP_RATE_PER_SEC = config.DEAD_CHAT_SWEEP_RATE
+
+# Error classes
+FORBIDDEN = "forbidden"      # bot blocked by user / kicked from group
+NOT_FOUND = "not_found"      # chat deleted or never existed
+MIGRATED = "migrated"        # group upgraded to supergroup
+RESTRICTED = "restricted"    # chat exists but the bot may not post there
+TRANSIENT = "transient"      # flood control, timeouts, network
+PAYLOAD = "payload"          # the message itself was rejected (empty text, bad file_id, long caption)
+OTHER = "other"
+
+PERMANENT = (FORBIDDEN, NOT_FOUND)
+# Errors that would fail the same way for every recipient of a broadcast.
+MESSAGE_ERRORS = (PAYLOAD, OTHER)
+
+_RESTRICTED_MARKERS = (
+    "not enough rights", "have no rights", "chat_write_forbidden", "chat_restricted",
+    "need administrator rights", "topic_closed", "topic closed",
+)
+
+KINDS = {"group": GROUPS_FILE, "user": USERS_FILE}
+
+
+def classify_error(exc: Exception) -> str:
+    if isinstance(exc, ChatMigrated):
+        return MIGRATED
+    if isinstance(exc, Forbidden):
+        return FORBIDDEN
+    if isinstance(exc, (RetryAfter, TimedOut, NetworkError)) and not isinstance(exc, BadRequest):
+        return TRANSIENT
+    if isinstance(exc, BadRequest):
+        message = str(exc).lower()
+        if "chat not found" in message or "user not found" in message or "peer_id_invalid" in message:
+            return NOT_FOUND
+        if "deactivated" in message or "kicked" in message or "not a member" in message:
+            return FORBIDDEN
+        if any(marker in message for marker in _RESTRICTED_MARKERS):
+            return RESTRICTED
+        return PAYLOAD
+    return OTHER
+
+
+class ChatHealthTracker:
+    """
+    Per-recipient delivery state for groups and users.
+
+    Outcomes are collected in memory during a broadcast and persisted once
+    with flush(), so a 3,000-chat broadcast costs one write, not 3,000.
+    Dead recipients are pruned from groups.json/users.json immediately.
+    """
+
+    def __init__(self, path: str = HEALTH_FILE):
+        self.path = path
+        self._pending: Dict[str, Dict[str, dict]] = {kind: {} for kind in KINDS}
+
+    def _entry(self, kind: str, chat_id) -> dict:
+        return self._pending[kind].setdefault(str(chat_id), {})
+
+    def record_success(self, kind: str, chat_id) -> None:
+        # A success wipes any failures recorded earlier in this batch.
+        self._pending[kind][str(chat_id)] = {"last_ok": time.time(), "reset": True}
+
+    def record_failure(self, kind: str, chat_id, exc: Exception) -> str:
+        """Classify the error, prune or migrate if needed, and return the class."""
+        error_class = classify_error(exc)
+        chat_id = str(chat_id)
+        if error_class == MIGRATED:
+            self.migrate(kind, chat_id, str(exc.new_chat_id))
+        elif error_class in PERMANENT:
+            self.prune(kind, chat_id, error_class)
+        elif error_class in (RESTRICTED, TRANSIENT):
+            now = time.time()
+            entry = self._entry(kind, chat_id)
+            entry.update({"last_fail": now, "last_checked": now, "last_error": error_class})
+            # Only errors about the chat itself count; an outage or a broken
+            # message would otherwise strike every recipient.
+            if error_class == RESTRICTED:
+                entry["fails_delta"] = entry.get("fails_delta", 0) + 1
+        return error_class
+
+    def mark_alive(self, kind: str, chat_id) -> None:
+        self.record_success(kind, chat_id)
+
+    def prune(self, kind: str, chat_id, reason: str) -> bool:
+        chat_id = str(chat_id)
+
+        def remove(items) -> bool:
+            before = len(items)
+            items[:] = [x for x in items if str(x) != chat_id]
+            return len(items) != before
+
+        removed = update_json(KINDS[kind], remove, [])
+        self._pending[kind][chat_id] = {"dead": reason}
+        if removed:
+            segments.member_removed(kind, chat_id)
+            logger.info("Pruned dead %s %s (%s)", kind, chat_id, reason)
+        return removed
+
+    def migrate(self, kind: str, old_id, new_id) -> None:
+        old_id, new_id = str(old_id), str(new_id)
+
+        def replace(items) -> bool:
+            ids = [str(x) for x in items]
+            if old_id not in ids:
+                return False
+            items[:] = [x for x in ids if x != old_id]
+            if new_id not in items:
+                items.append(new_id)
+            return True
+
+        replaced = update_json(KINDS[kind], replace, [])
+        segments.migrate(kind, old_id, new_id)
+        if replaced:
+            segments.member_removed(kind, old_id)
+            segments.member_added(kind, new_id)
+            logger.info("Migrated %s %s -> %s", kind, old_id, new_id)
+        self._pending[kind][old_id] = {"dead": MIGRATED}
+        self._pending[kind][new_id] = {"last_ok": time.time(), "reset": True}
+
+    def flush(self) -> None:
+        """Persist pending outcomes; prune recipients with too many transient failures."""
+        pending, self._pending = self._pending, {kind: {} for kind in KINDS}
+        if not any(pending.values()):
+            return
+        flaky = []
+
+        def merge(health) -> bool:
+            for kind, entries in pending.items():
+                section = health.setdefault(kind, {})
+                for chat_id, update in entries.items():
+                    if "dead" in update:
+                        section.pop(chat_id, None)
+                        continue
+                    current = section.get(chat_id, {})
+                    if update.pop("reset", False):
+                        current["fails"] = 0
+                        current.pop("last_error", None)
+                    current["fails"] = current.get("fails", 0) + update.pop("fails_delta", 0)
+                    current.update(update)
+                    section[chat_id] = current
+                    if current["fails"] >= TRANSIENT_STRIKES:
+                        flaky.append((kind, chat_id, current["fails"]))
+            return True
+
+        update_json(self.path, merge, {})
+        for kind, chat_id, fails in flaky:
+            self.prune(kind, chat_id, f"{fails} consecutive failures")
+        if flaky:
+            self.flush()
+
+    def stale_chats(self, now: Optional[float] = None, limit: int = SWEEP_BATCH):
+        """Recipients whose reachability has not been confirmed within STALE_SECONDS."""
+        now = now or time.time()
+        health = load_json(self.path, {})
+        stale = []
+        for kind, path in KINDS.items():
+            section = health.get(kind, {})
+            for chat_id in load_json(path, []):
+                entry = section.get(str(chat_id), {})
+                checked = max(entry.get("last_ok", 0), entry.get("last_checked", 0))
+                if now - checked >= STALE_SECONDS:
+                    stale.append((checked, kind, str(chat_id)))
+        stale.sort()
+        return [(kind, chat_id) for _, kind, chat_id in stale[:limit]]
+
+
+tracker = ChatHealthTracker()
+
+
+async def sweep_stale_chats(context) -> None:
+    """
+    Scheduler job: re-validate stale recipients against the Bot API, at most
+    SWEEP_RATE_PER_SEC calls per second, pruning the ones that are gone.
+    """
+    delay = 1.0 / SWEEP_RATE_PER_SEC if SWEEP_RATE_PER_SEC > 0 else 0
+    checked = pruned = 0
+    for kind, chat_id in tracker.stale_chats():
+        try:
+            if kind == "user":
+                # getChat still succeeds for users who blocked the bot; a chat
+                # action is the cheapest call that reports Forbidden.
+                await context.bot.send_chat_action(int(chat_id), ChatAction.TYPING)
+            else:
+                await context.bot.get_chat(int(chat_id))
+            tracker.mark_alive(kind, chat_id)
+        except RetryAfter as e:
+            logger.info("Sweeper hit flood control; stopping early for %ss", e.retry_after)
+            break
+        except Exception as e:
+            error_class = tracker.record_failure(kind, chat_id, e)
+            if error_class in PERMANENT:
+                pruned += 1
+        checked += 1
+        await asyncio.sleep(delay)
+    tracker.flush()
+    if checked:
+        logger.info("Dead-chat sweep checked %d chats, pruned %d", checked, pruned)
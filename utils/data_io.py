@@ -0,0 +1,497 @@
+# utils/data_io.py
+import os
+import re
+import csv
+import json
+import hashlib
+import logging
+import sqlite3
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import config
+from .json_utils import JSON_PRETTY, dumps
+from .lock_utils import file_lock
+
+logger = logging.getLogger("ChurchBot.data_io")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+CHUNK_SIZE = 1 << 20
+# A single record bigger than this is treated as corruption, which keeps
+# the reader's buffer bounded even on a damaged multi-gigabyte file.
+MAX_RECORD_SIZE = 16 << 20
+# Duplicate detection keeps this many keys in memory (~80 bytes each) before moving to disk.
+SEEN_MEMORY_KEYS = config.DATATOOL_MEMORY_KEYS
+# Invalid/duplicate examples kept per report; counts are always exact.
+REPORT_SAMPLES = 20
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class CorruptDataError(ValueError):
+    def __init__(self, offset: int, message: str):
+        super().__init__(f"{message} (character offset {offset})")
+        self.offset = offset
+
+
+# --- Schemas ---
+# IDs are stored as strings everywhere, which is what bot_utils writes.
+
+def _id(value) -> str:
+    if isinstance(value, bool):
+        raise SchemaError(f"invalid ID {value!r}")
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lstrip("-").isdigit():
+            return str(int(text))
+    raise SchemaError(f"invalid ID {value!r}")
+
+
+def _text(value, field: str) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise SchemaError(f"{field} must be a non-empty string")
+    return value.strip()
+
+
+def _field(record, name: str):
+    if not isinstance(record, dict):
+        raise SchemaError(f"expected an object with '{name}'")
+    if name not in record:
+        raise SchemaError(f"missing '{name}'")
+    return record[name]
+
+
+class Dataset:
+    """
+    How one data file is stored (`scalar`: a list of bare values) and how
+    its records look in JSON-lines/CSV (`fields`). `normalize` returns the
+    stored form or raises SchemaError; `key` identifies duplicates.
+    """
+
+    def __init__(self, filename: str, fields: List[str], normalize: Callable[[Any], Any],
+                 key: Callable[[Any], str] = None, scalar: bool = False, list_fields: Tuple[str, ...] = ()):
+        self.filename = filename
+        self.name = filename[:-len(".json")]
+        self.fields = fields
+        self.normalize = normalize
+        self.key = key or (lambda stored: dumps(stored).decode("utf-8"))
+        self.scalar = scalar
+        self.list_fields = list_fields
+
+    def to_record(self, stored) -> Dict:
+        return {self.fields[0]: stored} if self.scalar else stored
+
+    def from_record(self, record):
+        """Accept a record ({"id": ...}) or, for scalar datasets, a bare value."""
+        if self.scalar and isinstance(record, dict):
+            record = _field(record, self.fields[0])
+        return self.normalize(record)
+
+
+def _event(value) -> str:
+    return _text(value, "text")
+
+
+def _prayer(record) -> Dict:
+    return {"user": _id(_field(record, "user")), "text": _text(_field(record, "text"), "text")}
+
+
+def _quiz(record) -> Dict:
+    question = _text(_field(record, "question"), "question")
+    choices = _field(record, "choices")
+    if not isinstance(choices, list) or not 2 <= len(choices) <= 4:
+        raise SchemaError("choices must be a list of 2-4 strings")
+    choices = [_text(c, "choice") for c in choices]
+    answer = _text(_field(record, "answer"), "answer").upper()
+    if answer not in "ABCD"[:len(choices)]:
+        raise SchemaError(f"answer {answer!r} does not match a choice")
+    return {"question": question, "choices": choices, "answer": answer}
+
+
+DATASETS: Dict[str, Dataset] = {
+    d.name: d for d in (
+        Dataset("admins.json", ["id"], _id, key=str, scalar=True),
+        Dataset("groups.json", ["id"], _id, key=str, scalar=True),
+        Dataset("users.json", ["id"], _id, key=str, scalar=True),
+        Dataset("events.json", ["text"], _event, key=str, scalar=True),
+        Dataset("prayers.json", ["user", "text"], _prayer),
+        Dataset("quizzes.json", ["question", "choices", "answer"], _quiz,
+                key=lambda q: q["question"].casefold(), list_fields=("choices",)),
+        Dataset("quiz_questions.json", ["question", "choices", "answer"], _quiz,
+                key=lambda q: q["question"].casefold(), list_fields=("choices",)),
+    )
+}
+
+
+def get_dataset(name: str) -> Dataset:
+    name = name[:-len(".json")] if name.endswith(".json") else name
+    if name not in DATASETS:
+        raise KeyError(f"Unknown dataset {name!r}; choose from {', '.join(DATASETS)}")
+    return DATASETS[name]
+
+
+# --- Streaming JSON array reader/writer ---
+
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_NUMBER_CHARS = re.compile(r"[0-9+\-.eE]*")
+
+
+def iter_json_array(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time. Memory is
+    bounded by chunk_size plus the largest element. Raises CorruptDataError
+    with the character offset of the first problem.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, base, eof = "", 0, False
+
+        def fill(pos: int) -> bool:
+            """Make buf[pos] available; False at end of file."""
+            nonlocal buf, eof
+            while pos >= len(buf) and not eof:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    buf += chunk
+                else:
+                    eof = True
+            return pos < len(buf)
+
+        def skip_ws(pos: int) -> int:
+            while True:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or not fill(pos):
+                    return pos
+
+        pos = skip_ws(0)
+        if not fill(pos) or buf[pos] != "[":
+            raise CorruptDataError(pos, "expected '['")
+        pos = skip_ws(pos + 1)
+        if fill(pos) and buf[pos] == "]":
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                complete, error = False, e
+            else:
+                # A number or literal touching the end of the buffer may continue in the next
+                # chunk; so may a number cut right after its '.' or exponent ("1." + "5").
+                complete = eof or _NUMBER_CHARS.match(buf, end).end() < len(buf)
+                error = None
+            if complete:
+                sep = skip_ws(end)
+                complete = fill(sep)
+            if not complete:
+                # Incomplete element at the end of the buffer: read on, up to a limit.
+                if not eof and len(buf) - pos < MAX_RECORD_SIZE:
+                    fill(len(buf))
+                    continue
+                if error is not None:
+                    raise CorruptDataError(base + error.pos, error.msg)
+                raise CorruptDataError(base + len(buf), "unterminated array")
+            if buf[sep] not in ",]":
+                raise CorruptDataError(base + sep, "expected ',' or ']'")
+            yield item
+            if buf[sep] == "]":
+                tail = skip_ws(sep + 1)
+                if fill(tail):
+                    raise CorruptDataError(base + tail, "data after the closing ']'")
+                return
+            pos = skip_ws(sep + 1)
+            if pos > chunk_size:
+                base += pos
+                buf, pos = buf[pos:], 0
+
+
+_UNCHECKED = object()
+
+
+def _replace_when_unchanged(tmp_path: str, target: str, expected_stat) -> None:
+    """os.replace under the dataset lock, refusing if the target changed since it was read."""
+    with file_lock(target):
+        if expected_stat is not _UNCHECKED and _stat(target) != expected_stat:
+            raise RuntimeError(f"{target} changed while it was being rewritten; run the command again.")
+        os.replace(tmp_path, target)
+
+
+def _stat(path: str) -> Optional[Tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def write_json_array(target: str, items: Iterable, pretty: bool = None, expected_stat=_UNCHECKED) -> int:
+    """
+    Stream items into a new file next to `target` and swap it in atomically.
+    With expected_stat (from _stat(); None for "did not exist"), the swap is
+    refused if `target` changed in the meantime, so concurrent bot writes
+    are never silently overwritten.
+    """
+    if pretty is None:
+        pretty = JSON_PRETTY
+    dirpath = os.path.dirname(target) or "."
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=dirpath)
+    count = 0
+    sep = b",\n  " if pretty else b","
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"[\n  " if pretty else b"[")
+            for item in items:
+                if count:
+                    f.write(sep)
+                encoded = dumps(item, pretty)
+                f.write(encoded.replace(b"\n", b"\n  ") if pretty else encoded)
+                count += 1
+            f.write(b"\n]" if pretty and count else b"]")
+        os.chmod(tmp_path, 0o644)
+        _replace_when_unchanged(tmp_path, target, expected_stat)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return count
+
+
+# --- Duplicate detection in bounded memory ---
+
+class SeenKeys:
+    """
+    A set of record keys (16-byte digests). Kept in memory up to
+    SEEN_MEMORY_KEYS, then spilled to a temporary on-disk SQLite table, so
+    memory stays bounded on arbitrarily large datasets.
+    """
+
+    def __init__(self, memory_keys: int = SEEN_MEMORY_KEYS):
+        self.memory_keys = memory_keys
+        self._keys = set()
+        self._conn = None
+        self.path = None
+
+    def _spill(self) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="churchbot-seen-", suffix=".db")
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE seen (k BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._conn.executemany("INSERT INTO seen VALUES (?)", ((k,) for k in sorted(self._keys)))
+        self._keys = set()
+        logger.info("Duplicate index exceeded %d keys; continuing on disk.", self.memory_keys)
+
+    def add(self, key: str) -> bool:
+        """Record key; False if it was already present."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        if self._conn is not None:
+            return self._conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,)).rowcount == 1
+        if digest in self._keys:
+            return False
+        self._keys.add(digest)
+        if len(self._keys) > self.memory_keys:
+            self._spill()
+        return True
+
+    def close(self) -> None:
+        self._keys = set()
+        if self._conn is None:
+            return
+        self._conn.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Reports ---
+
+class Report:
+    def __init__(self, dataset: str):
+        self.dataset = dataset
+        self.records = 0
+        self.written = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.noncanonical = 0
+        self.corrupt: Optional[str] = None
+        self.samples: List[str] = []
+
+    def sample(self, message: str) -> None:
+        if len(self.samples) < REPORT_SAMPLES:
+            self.samples.append(message)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.corrupt or self.invalid or self.duplicates or self.noncanonical)
+
+    def summary(self) -> str:
+        parts = [f"{self.dataset}: {self.records} records"]
+        if self.written:
+            parts.append(f"{self.written} written")
+        for label, value in (("invalid", self.invalid), ("duplicates", self.duplicates),
+                             ("non-canonical", self.noncanonical)):
+            if value:
+                parts.append(f"{value} {label}")
+        if self.corrupt:
+            parts.append(f"CORRUPT ({self.corrupt})")
+        lines = [", ".join(parts)]
+        lines += [f"  - {s}" for s in self.samples]
+        return "\n".join(lines)
+
+
+def _clean(dataset: Dataset, records: Iterable[Tuple[str, Any]], report: Report, seen: SeenKeys,
+           existing: bool = False) -> Iterator[Any]:
+    """Normalize, validate and deduplicate (location, record) pairs into stored values."""
+    for where, record in records:
+        report.records += 1
+        if record is None:
+            report.invalid += 1
+            report.sample(f"{where}: unparseable or empty record")
+            continue
+        try:
+            stored = dataset.from_record(record)
+        except SchemaError as e:
+            report.invalid += 1
+            report.sample(f"{where}: {e}")
+            continue
+        if existing and stored != record:
+            report.noncanonical += 1
+        if not seen.add(dataset.key(stored)):
+            report.duplicates += 1
+            report.sample(f"{where}: duplicate")
+            continue
+        report.written += 1
+        yield stored
+
+
+def _dataset_path(dataset: Dataset, data_dir: str) -> str:
+    return os.path.join(data_dir, dataset.filename)
+
+
+def _stored_records(path: str) -> Iterator[Tuple[str, Any]]:
+    for index, item in enumerate(iter_json_array(path)):
+        yield f"#{index}", item
+
+
+# --- Export ---
+
+def export_dataset(dataset: Dataset, out, fmt: str = "jsonl", data_dir: str = DATA_DIR) -> int:
+    """Stream one dataset to a text file object as JSON-lines or CSV. Returns the count."""
+    path = _dataset_path(dataset, data_dir)
+    if not os.path.exists(path):
+        return 0
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=dataset.fields, extrasaction="ignore")
+        writer.writeheader()
+    count = 0
+    for item in iter_json_array(path):
+        record = dataset.to_record(item)
+        if writer is not None:
+            row = dict(record) if isinstance(record, dict) else {dataset.fields[0]: record}
+            for name in dataset.list_fields:
+                row[name] = json.dumps(row.get(name), ensure_ascii=False)
+            writer.writerow(row)
+        else:
+            out.write(dumps(record).decode("utf-8") + "\n")
+        count += 1
+    return count
+
+
+# --- Import ---
+
+def read_records(source, fmt: str, dataset: Dataset) -> Iterator[Tuple[str, Any]]:
+    """(location, record) pairs from a JSON-lines or CSV text file object."""
+    if fmt == "csv":
+        for lineno, row in enumerate(csv.DictReader(source), start=2):
+            record = {k: v for k, v in row.items() if k in dataset.fields}
+            try:
+                for name in dataset.list_fields:
+                    if isinstance(record.get(name), str):
+                        record[name] = json.loads(record[name])
+            except ValueError:
+                yield f"line {lineno}", None  # reported as invalid
+                continue
+            yield f"line {lineno}", record
+        return
+    for lineno, line in enumerate(source, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield f"line {lineno}", json.loads(line)
+        except ValueError:
+            yield f"line {lineno}", None
+
+
+def import_dataset(dataset: Dataset, source, fmt: str = "jsonl", replace: bool = False,
+                   dry_run: bool = False, data_dir: str = DATA_DIR) -> Report:
+    """
+    Stream records into a dataset. By default they are merged after the
+    existing records; replace=True discards those. Records are normalized,
+    validated and deduplicated on the way; invalid ones are reported and
+    skipped. The dataset is swapped in atomically at the end.
+    """
+    path = _dataset_path(dataset, data_dir)
+    report = Report(dataset.name)
+    before = _stat(path)
+    with SeenKeys() as seen:
+        def records():
+            if not replace and before is not None:
+                yield from _stored_records(path)
+            yield from read_records(source, fmt, dataset)
+
+        cleaned = _clean(dataset, records(), report, seen)
+        if dry_run:
+            for _ in cleaned:
+                pass
+        else:
+            write_json_array(path, cleaned, expected_stat=before)
+    logger.info("Imported %s: %s", dataset.name, report.summary().splitlines()[0])
+    return report
+
+
+def normalize_dataset(dataset: Dataset, data_dir: str = DATA_DIR) -> Report:
+    """Rewrite a dataset in canonical form (string IDs), dropping invalid and duplicate records."""
+    path = _dataset_path(dataset, data_dir)
+    report = Report(dataset.name)
+    before = _stat(path)
+    if before is None:
+        return report
+    with SeenKeys() as seen:
+        write_json_array(path, _clean(dataset, _stored_records(path), report, seen, existing=True),
+                         expected_stat=before)
+    return report
+
+
+# --- Integrity check ---
+
+def check_dataset(dataset: Dataset, data_dir: str = DATA_DIR) -> Report:
+    """Stream a dataset and count corrupt, invalid, duplicate and non-canonical records."""
+    path = _dataset_path(dataset, data_dir)
+    report = Report(dataset.name)
+    if not os.path.exists(path):
+        return report
+    with SeenKeys() as seen:
+        try:
+            for _ in _clean(dataset, _stored_records(path), report, seen, existing=True):
+                pass
+        except CorruptDataError as e:
+            report.corrupt = str(e)
+        except UnicodeDecodeError as e:
+            report.corrupt = f"invalid UTF-8 at byte {e.start}"
+    report.written = 0
+    return report
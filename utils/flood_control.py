@@ -0,0 +1,196 @@
+# utils/flood_control.py
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import config
+from .bot_utils import is_admin
+from .router import parse_command
+
+logger = logging.getLogger("ChurchBot.flood_control")
+
+USER_CAPACITY = config.FLOOD_USER_CAPACITY
+USER_REFILL_PER_SEC = config.FLOOD_USER_REFILL
+CHAT_CAPACITY = config.FLOOD_CHAT_CAPACITY
+CHAT_REFILL_PER_SEC = config.FLOOD_CHAT_REFILL
+MAX_TRACKED_KEYS = config.FLOOD_MAX_KEYS
+DEDUP_WINDOW = config.FLOOD_DEDUP_WINDOW
+
+DEFAULT_COST = 1.0
+# Relative cost of each command; plain messages and button presses cost DEFAULT_COST.
+COMMAND_COSTS: Dict[str, float] = {
+    "tran": 5.0,
+    "quiz": 3.0,
+    "prayer": 2.0,
+    "prayerlist": 2.0,
+    "myid": 0.5,
+    "chatid": 0.5,
+    "start": 0.5,
+    "cmd": 0.5,
+}
+
+
+def _parse_costs(spec: str) -> Dict[str, float]:
+    """Parse FLOOD_COMMAND_COSTS, e.g. "tran=5,quiz=3,myid=0.5"."""
+    costs = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        try:
+            costs[name.strip().lstrip("/").lower()] = float(value)
+        except ValueError:
+            if part.strip():
+                logger.warning("Ignoring malformed FLOOD_COMMAND_COSTS entry: %r", part)
+    return costs
+
+
+COMMAND_COSTS.update(_parse_costs(config.FLOOD_COMMAND_COSTS))
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by user or chat ID, held in a bounded LRU.
+
+    A bucket that has been idle long enough to refill completely is
+    indistinguishable from a new one, so it is dropped; together with the
+    MAX_TRACKED_KEYS cap this keeps memory flat regardless of user count.
+    """
+
+    def __init__(self, capacity: float, refill_per_sec: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.max_keys = max_keys
+        self.idle_ttl = capacity / refill_per_sec if refill_per_sec > 0 else float("inf")
+        # key -> [tokens, last_refill, notified]
+        self._buckets: "OrderedDict[object, list]" = OrderedDict()
+
+    def _bucket(self, key, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.capacity, now, False]
+            self._buckets[key] = bucket
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_sec)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _expire(self, now: float) -> None:
+        # Oldest-touched first: stop at the first bucket that is still warm.
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - bucket[1] < self.idle_ttl:
+                break
+            self._buckets.popitem(last=False)
+
+    def consume(self, key, cost: float, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(key, now)
+        self._expire(now)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            bucket[2] = False
+            return True
+        return False
+
+    def retry_after(self, key, cost: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None or self.refill_per_sec <= 0:
+            return 0.0
+        return max(0.0, (cost - bucket[0]) / self.refill_per_sec)
+
+    def should_notify(self, key) -> bool:
+        """True only for the first rejection since the key was last allowed."""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RecentUpdates:
+    """Fixed-size window of recently processed update IDs."""
+
+    def __init__(self, size: int = DEDUP_WINDOW):
+        self._order = deque(maxlen=size)
+        self._seen = set()
+
+    def seen(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            return True
+        if len(self._order) == self._order.maxlen:
+            self._seen.discard(self._order[0])
+        self._order.append(update_id)
+        self._seen.add(update_id)
+        return False
+
+
+user_limiter = TokenBucketLimiter(USER_CAPACITY, USER_REFILL_PER_SEC)
+chat_limiter = TokenBucketLimiter(CHAT_CAPACITY, CHAT_REFILL_PER_SEC)
+recent_updates = RecentUpdates()
+
+
+def command_of(update: Update) -> Optional[str]:
+    parsed = parse_command(update)
+    return parsed[0] if parsed else None
+
+
+def cost_of(update: Update) -> float:
+    command = command_of(update)
+    if command is None:
+        return DEFAULT_COST
+    return COMMAND_COSTS.get(command, DEFAULT_COST)
+
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Runs before every other handler (registered in group -1). Drops updates
+    already seen (e.g. redelivered after a reconnect) and updates from users
+    or chats that exhausted their token bucket; raising ApplicationHandlerStop
+    keeps them away from the real handlers. Only commands and button presses
+    get a cooldown notice: members chatting in a busy group never addressed
+    the bot, so their throttled messages are dropped silently.
+    """
+    if not isinstance(update, Update):
+        return
+    if recent_updates.seen(update.update_id):
+        logger.debug("Dropping duplicate update %s", update.update_id)
+        raise ApplicationHandlerStop
+
+    user = update.effective_user
+    if user is None or not (update.message or update.callback_query or update.edited_message):
+        return
+
+    cost = cost_of(update)
+    chat = update.effective_chat
+    user_ok = user_limiter.consume(user.id, cost)
+    chat_ok = user_ok and (chat is None or chat_limiter.consume(chat.id, cost))
+    if chat_ok:
+        return
+    # Admins are never throttled; checked only here so it costs no disk read on the hot path.
+    if is_admin(user.id):
+        return
+
+    limiter, key = (user_limiter, user.id) if not user_ok else (chat_limiter, chat.id)
+    wait = int(limiter.retry_after(key, cost)) + 1
+    addressed = update.callback_query is not None or command_of(update) is not None
+    if not addressed:
+        logger.debug("Flood control: dropping plain message from %s", key)
+    elif limiter.should_notify(key):
+        logger.info("Flood control: throttling %s for ~%ds", key, wait)
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(f"⏳ Slow down — try again in {wait}s.")
+            elif update.effective_message:
+                await update.effective_message.reply_text(
+                    f"⏳ Too many requests. Please wait {wait}s.\nခဏစောင့်ပြီးမှ ပြန်ကြိုးစားပါ။"
+                )
+        except Exception:
+            logger.debug("Could not send cooldown notice to %s", key)
+    raise ApplicationHandlerStop
@@ -1,11 +1,147 @@
 # utils/json_utils.py
 import os
 import json
+import copy
 import logging
-from typing import Any, Dict
+import tempfile
+from typing import Any, Callable, Dict
+
+import config
+from .lock_utils import file_lock
 
 logger = logging.getLogger("ChurchBot.json_utils")
 
+# Pick the fastest available codec: orjson > ujson > stdlib json.
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+try:
+    import ujson as _ujson
+except ImportError:
+    _ujson = None
+
+if _orjson is not None:
+    JSON_BACKEND = "orjson"
+elif _ujson is not None:
+    JSON_BACKEND = "ujson"
+else:
+    JSON_BACKEND = "json"
+
+# Compact output by default; set JSON_PRETTY=true to keep the old indent=2 files.
+JSON_PRETTY = config.JSON_PRETTY
+
+# Lists longer than this are encoded item by item instead of as one big string.
+STREAM_THRESHOLD = config.JSON_STREAM_THRESHOLD
+STREAM_CHUNK = 256
+
+# Integer literals that may not fit in 64 bits have 20+ digits, or 19 after a
+# minus sign. Mapping digits to "0" and everything but "-" to " " turns the
+# check into two C-speed substring searches; a regex took ~25 ms per MB.
+_DIGIT_MASK = bytes(c if c == 0x2D else 0x30 if 0x30 <= c <= 0x39 else 0x20 for c in range(256))
+_WIDE_INT_RUNS = (b"0" * 20, b"-" + b"0" * 19)
+
+
+def _may_hold_wide_int(raw) -> bool:
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    masked = raw.translate(_DIGIT_MASK)
+    return any(run in masked for run in _WIDE_INT_RUNS)
+
+
+def _stdlib_dumps(data, pretty: bool) -> bytes:
+    if pretty:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def dumps(data, pretty: bool = False) -> bytes:
+    """Encode data to UTF-8 JSON bytes with the fastest available codec."""
+    if _orjson is not None:
+        option = _orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= _orjson.OPT_INDENT_2
+        try:
+            return _orjson.dumps(data, option=option)
+        except TypeError:
+            # e.g. integers wider than 64 bits; stdlib handles them.
+            logger.debug("orjson could not encode value; falling back to json.")
+    elif _ujson is not None:
+        try:
+            if pretty:
+                text = _ujson.dumps(data, ensure_ascii=False, indent=2, escape_forward_slashes=False)
+            else:
+                text = _ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False)
+            return text.encode("utf-8")
+        except (TypeError, OverflowError):
+            logger.debug("ujson could not encode value; falling back to json.")
+    return _stdlib_dumps(data, pretty)
+
+
+def loads(raw):
+    """Decode JSON from str or bytes. Accepts both compact and indented files."""
+    try:
+        if _orjson is not None:
+            # orjson silently decodes integers wider than 64 bits as floats,
+            # so documents that may contain one go to stdlib json instead.
+            if not _may_hold_wide_int(raw):
+                return _orjson.loads(raw)
+        elif _ujson is not None:
+            return _ujson.loads(raw)
+    except ValueError:
+        # Let stdlib json decide what the fast codec rejected, so a readable
+        # file is never treated as corrupt.
+        pass
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8")
+    return json.loads(raw)
+
+
+def _write_stream(f, data: list, pretty: bool) -> None:
+    """Write a large list one chunk of items at a time."""
+    if not data:
+        f.write(b"[]")
+        return
+    sep = b",\n" if pretty else b","
+    f.write(b"[\n" if pretty else b"[")
+    for start in range(0, len(data), STREAM_CHUNK):
+        parts = []
+        for item in data[start:start + STREAM_CHUNK]:
+            encoded = dumps(item, pretty)
+            if pretty:
+                encoded = b"\n".join(b"  " + line for line in encoded.split(b"\n"))
+            parts.append(encoded)
+        if start:
+            f.write(sep)
+        f.write(sep.join(parts))
+    f.write(b"\n]" if pretty else b"]")
+
+
+def _write_atomic(file_path: str, data, pretty: bool) -> None:
+    dirpath = os.path.dirname(file_path) or "."
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=dirpath)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            try:
+                os.chmod(tmp_path, os.stat(file_path).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
+            if isinstance(data, list) and len(data) > STREAM_THRESHOLD:
+                _write_stream(f, data, pretty)
+            else:
+                f.write(dumps(data, pretty))
+        os.replace(tmp_path, file_path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def init_data_files(data_dir: str) -> None:
     os.makedirs(data_dir, exist_ok=True)
 
@@ -13,26 +149,35 @@ def init_data_files(data_dir: str) -> None:
         "admins.json": [],
         "groups.json": [],
         "prayers.json": [],
-        "events.json": []
+        "events.json": [],
+        "users.json": []
     }
 
     for filename, default in files_with_defaults.items():
         path = os.path.join(data_dir, filename)
         if not os.path.exists(path):
             try:
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(default, f, ensure_ascii=False, indent=2)
+                _write_atomic(path, default, JSON_PRETTY)
                 logger.info("Created %s with default value.", path)
             except Exception as e:
                 logger.exception("Failed to initialize %s: %s", path, e)
         else:
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    json.load(f)
+                with open(path, "rb") as f:
+                    loads(f.read())
             except Exception:
+                # Prefer the latest good snapshot over wiping the dataset.
+                from .backup_utils import restore_latest_good
                 try:
-                    with open(path, "w", encoding="utf-8") as f:
-                        json.dump(default, f, ensure_ascii=False, indent=2)
+                    snapshot_id = restore_latest_good(filename, data_dir=data_dir)
+                except Exception:
+                    logger.exception("Snapshot restore of %s failed.", path)
+                    snapshot_id = None
+                if snapshot_id:
+                    logger.warning("Restored corrupted file %s from snapshot %s.", path, snapshot_id)
+                    continue
+                try:
+                    _write_atomic(path, default, JSON_PRETTY)
                     logger.warning("Reinitialized corrupted file %s with default.", path)
                 except Exception as e:
                     logger.exception("Failed to reinitialize %s: %s", path, e)
@@ -41,20 +186,56 @@ def load_json(file_path: str, default=None):
     if default is None:
         default = []
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+        with open(file_path, "rb") as f:
+            return loads(f.read())
+    except (FileNotFoundError, ValueError):
+        # ValueError covers json/orjson/ujson decode errors alike.
         return default
     except Exception as e:
         logger.exception("Unexpected error loading %s: %s", file_path, e)
         return default
 
-def save_json(file_path: str, data) -> None:
+def save_json(file_path: str, data, pretty: bool = None) -> None:
+    """Write data atomically. Compact unless pretty=True (or JSON_PRETTY is set)."""
+    if pretty is None:
+        pretty = JSON_PRETTY
     try:
-        dirpath = os.path.dirname(file_path)
-        if dirpath and not os.path.exists(dirpath):
-            os.makedirs(dirpath, exist_ok=True)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with file_lock(file_path):
+            _write_atomic(file_path, data, pretty)
     except Exception as e:
         logger.exception("Error saving %s: %s", file_path, e)
+
+
+# --- Cross-process safe read-modify-write ---
+# Several bot processes may share DATA_DIR. Plain load_json/save_json pairs
+# race (last writer wins), so mutations go through update_json. `mutate` runs
+# with the lock held, so it must not await; callers that need network I/O
+# do it first and apply the result in a second, synchronous mutation.
+
+def _read_locked(file_path: str, default):
+    try:
+        with open(file_path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return copy.deepcopy(default)
+    try:
+        return loads(raw)
+    except ValueError:
+        return copy.deepcopy(default)
+
+
+def update_json(file_path: str, mutate: Callable[[Any], bool], default=None, pretty: bool = None) -> bool:
+    """
+    Load, mutate in place and save under the dataset lock.
+    `mutate` returns True when it changed the data; nothing is written otherwise.
+    """
+    if default is None:
+        default = []
+    if pretty is None:
+        pretty = JSON_PRETTY
+    with file_lock(file_path):
+        data = _read_locked(file_path, default)
+        changed = bool(mutate(data))
+        if changed:
+            _write_atomic(file_path, data, pretty)
+        return changed
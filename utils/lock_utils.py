@@ -0,0 +1,132 @@
+# utils/lock_utils.py
+import os
+import socket
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-instance only
+    fcntl = None
+
+import config
+
+logger = logging.getLogger("ChurchBot.lock_utils")
+
+LEASE_TTL_SECONDS = config.LEADER_LEASE_TTL
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an advisory flock on `<path>.lock` for the duration of the block.
+    Every bot process pointed at the same DATA_DIR serializes on this lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = path + ".lock"
+    dirpath = os.path.dirname(lock_path)
+    if dirpath:
+        os.makedirs(dirpath, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class LeaderElector:
+    """
+    Lease-based leader election over a JSON lease file in DATA_DIR.
+
+    The leader renews its lease every ttl/3 seconds. If it dies, another
+    instance takes over once the lease expires (at most `ttl` seconds); a
+    clean shutdown releases the lease so takeover is immediate.
+    """
+
+    def __init__(self, lease_path: str, ttl: float = LEASE_TTL_SECONDS, instance_id: str = INSTANCE_ID):
+        self.lease_path = lease_path
+        self.ttl = ttl
+        self.instance_id = instance_id
+        self._is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def try_acquire(self) -> bool:
+        # Imported here: json_utils itself locks through this module.
+        from .json_utils import update_json
+
+        now = time.time()
+        previous = {}
+
+        def claim(lease) -> bool:
+            previous.update(lease)
+            owner = lease.get("owner")
+            if owner in (None, self.instance_id) or float(lease.get("expires", 0)) <= now:
+                lease.update({"owner": self.instance_id, "expires": now + self.ttl})
+                return True
+            return False
+
+        acquired = update_json(self.lease_path, claim, {})
+        if acquired and not self._is_leader:
+            logger.info("Instance %s became scheduler leader.", self.instance_id)
+        elif not acquired and self._is_leader:
+            logger.warning("Instance %s lost scheduler leadership to %s.", self.instance_id, previous.get("owner"))
+        self._is_leader = acquired
+        return acquired
+
+    def release(self) -> None:
+        from .json_utils import update_json
+
+        if not self._is_leader:
+            return
+
+        def clear(lease) -> bool:
+            if lease.get("owner") != self.instance_id:
+                return False
+            lease.update({"owner": None, "expires": 0})
+            return True
+
+        update_json(self.lease_path, clear, {})
+        self._is_leader = False
+        logger.info("Instance %s released scheduler leadership.", self.instance_id)
+
+    def _run(self) -> None:
+        interval = max(self.ttl / 3.0, 0.1)
+        while not self._stop.is_set():
+            try:
+                self.try_acquire()
+            except Exception:
+                logger.exception("Leader lease renewal failed.")
+                self._is_leader = False
+            self._stop.wait(interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-elector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.ttl)
+        try:
+            self.release()
+        except Exception:
+            logger.exception("Failed to release leader lease.")
@@ -0,0 +1,243 @@
+# utils/media_utils.py
+import os
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+from telegram import (
+    InlineKeyboardMarkup,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+    Message,
+)
+from telegram.error import BadRequest
+
+import config
+from .json_utils import load_json, update_json
+
+logger = logging.getLogger("ChurchBot.media_utils")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+FILE_ID_CACHE_FILE = os.path.join(DATA_DIR, "file_ids.json")
+
+# Local assets admins may broadcast with `/broadcast file <name>`.
+MEDIA_DIR = config.MEDIA_DIR
+
+# Recently seen albums, so /broadcast can reply to any message of an album.
+ALBUM_CACHE_SIZE = config.ALBUM_CACHE_SIZE
+
+MEDIA_TYPES = ("photo", "video", "animation", "document", "audio", "voice")
+_INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+_albums: "OrderedDict[str, List[Message]]" = OrderedDict()
+
+
+def remember_album_message(message: Message) -> None:
+    group_id = message.media_group_id
+    if not group_id:
+        return
+    items = _albums.setdefault(group_id, [])
+    if all(m.message_id != message.message_id for m in items):
+        items.append(message)
+        items.sort(key=lambda m: m.message_id)
+    _albums.move_to_end(group_id)
+    while len(_albums) > ALBUM_CACHE_SIZE:
+        _albums.popitem(last=False)
+
+
+_EXTENSION_TYPES = {
+    ".jpg": "photo", ".jpeg": "photo", ".png": "photo", ".webp": "photo",
+    ".mp4": "video", ".mov": "video",
+    ".gif": "animation",
+    ".mp3": "audio", ".m4a": "audio",
+    ".ogg": "voice",
+}
+
+
+def media_asset_path(name: str) -> Optional[str]:
+    """Resolve a file name inside MEDIA_DIR; None if missing or outside it."""
+    base = os.path.realpath(MEDIA_DIR)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.dirname(path) != base or not os.path.isfile(path):
+        return None
+    return path
+
+
+def media_type_for_path(path: str) -> str:
+    return _EXTENSION_TYPES.get(os.path.splitext(path)[1].lower(), "document")
+
+
+def _file_of(message: Message):
+    """Return (media_type, file object) for the first media attachment found."""
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type, None)
+        if media:
+            if media_type == "photo":
+                media = media[-1]  # largest size
+            return media_type, media
+    return None, None
+
+
+# --- Persistent file_id cache for local assets ---
+# Keyed by a (path, size, mtime) fingerprint, so editing the file forces one
+# fresh upload while repeat broadcasts of the same asset upload nothing.
+
+def _path_key(path: str) -> str:
+    st = os.stat(path)
+    return f"path:{os.path.abspath(path)}:{st.st_size}:{int(st.st_mtime)}"
+
+
+def cached_file_id(key: str) -> Optional[str]:
+    return load_json(FILE_ID_CACHE_FILE, {}).get(key)
+
+
+def remember_file_id(key: str, file_id: str) -> None:
+    def mutate(cache) -> bool:
+        if cache.get(key) == file_id:
+            return False
+        cache[key] = file_id
+        return True
+    update_json(FILE_ID_CACHE_FILE, mutate, {})
+
+
+def forget_file_id(key: str) -> None:
+    update_json(FILE_ID_CACHE_FILE, lambda cache: cache.pop(key, None) is not None, {})
+
+
+_STALE_FILE_ID_MARKERS = ("wrong file identifier", "wrong remote file", "file reference", "file_reference", "media_empty")
+
+
+def _is_stale_file_id(exc: Exception) -> bool:
+    message = str(exc).lower()
+    return isinstance(exc, BadRequest) and any(marker in message for marker in _STALE_FILE_ID_MARKERS)
+
+
+class BroadcastPayload:
+    """
+    What /broadcast fans out: plain text, one media item or an album.
+
+    Media is sent by file_id; a local `path` is uploaded to the first
+    recipient only and the resulting file_id is reused (and cached across
+    broadcasts) for everyone else. If Telegram rejects a cached file_id,
+    the asset is uploaded again. With copy=True the source message is
+    copied with copyMessage instead.
+    """
+
+    def __init__(self, kind: str, text: str = None, entities=None, file_id: str = None, path: str = None,
+                 items=None, reply_markup=None, source: Message = None, copy: bool = False):
+        self.kind = kind
+        self.text = text
+        self.entities = entities
+        self.file_id = file_id
+        self.path = path
+        self.items = items or []
+        self.reply_markup = reply_markup
+        self.source = source
+        self.copy = copy
+
+    @classmethod
+    def from_text(cls, text: str) -> "BroadcastPayload":
+        return cls("text", text=text)
+
+    @classmethod
+    def from_path(cls, path: str, caption: str = None, media_type: str = None) -> "BroadcastPayload":
+        media_type = media_type or media_type_for_path(path)
+        return cls(media_type, text=caption, file_id=cached_file_id(_path_key(path)), path=path)
+
+    @classmethod
+    def from_message(cls, message: Message, copy: bool = False) -> Optional["BroadcastPayload"]:
+        """
+        None for messages that can only be copied (stickers, polls, locations,
+        video notes...) unless copy=True, since sending them would fail for
+        every recipient.
+        """
+        markup = message.reply_markup if isinstance(message.reply_markup, InlineKeyboardMarkup) else None
+        album = _albums.get(message.media_group_id) if message.media_group_id else None
+        if album and len(album) > 1:
+            items = []
+            for m in album:
+                media_type, media = _file_of(m)
+                if media_type in _INPUT_MEDIA:
+                    items.append((media_type, media.file_id, m.caption, m.caption_entities))
+            if not items:
+                return None
+            return cls("album", items=items, source=message, copy=copy)
+
+        media_type, media = _file_of(message)
+        if media_type is None:
+            if not message.text and not copy:
+                return None
+            return cls("text", text=message.text, entities=message.entities, reply_markup=markup,
+                       source=message, copy=copy)
+        # Media in a received message is already on Telegram's servers, so its
+        # file_id is sent as-is: nothing is re-uploaded per recipient.
+        return cls(media_type, text=message.caption, entities=message.caption_entities, file_id=media.file_id,
+                   reply_markup=markup, source=message, copy=copy)
+
+    def texts(self) -> List[str]:
+        """Translatable strings: the text/caption, or each album caption."""
+        if self.kind == "album":
+            return [caption or "" for _, _, caption, _ in self.items]
+        return [self.text or ""]
+
+    def with_texts(self, texts: List[str]) -> "BroadcastPayload":
+        """
+        A copy carrying `texts` (as returned by texts()) instead. Formatting
+        entities are dropped since their offsets no longer apply, and the
+        variant is always sent, never copied.
+        """
+        if self.kind == "album":
+            items = [(media_type, file_id, text or None, None)
+                     for (media_type, file_id, _, _), text in zip(self.items, texts)]
+            return BroadcastPayload("album", items=items)
+        return BroadcastPayload(self.kind, text=texts[0] or None, file_id=self.file_id, path=self.path,
+                                reply_markup=self.reply_markup)
+
+    def _learn_file_id(self, sent: Message) -> None:
+        media_type, media = _file_of(sent)
+        if media is None:
+            return
+        remember_file_id(_path_key(self.path), media.file_id)
+        logger.info("Uploaded %s once; reusing file_id for remaining recipients.", self.path)
+        self.file_id = media.file_id
+
+    async def _upload(self, sender, chat_id: int):
+        with open(self.path, "rb") as f:
+            sent = await sender(chat_id, f, caption=self.text, caption_entities=self.entities,
+                                reply_markup=self.reply_markup)
+        self._learn_file_id(sent)
+        return sent
+
+    async def send(self, bot, chat_id: int):
+        if self.copy and self.source is not None and self.kind != "album":
+            return await bot.copy_message(chat_id, self.source.chat_id, self.source.message_id,
+                                          reply_markup=self.reply_markup)
+        if self.kind == "text":
+            return await bot.send_message(chat_id, self.text, entities=self.entities, reply_markup=self.reply_markup)
+        if self.kind == "album":
+            media = [
+                _INPUT_MEDIA[media_type](file_id, caption=caption, caption_entities=entities)
+                for media_type, file_id, caption, entities in self.items
+            ]
+            return await bot.send_media_group(chat_id, media)
+
+        sender = getattr(bot, f"send_{self.kind}")
+        if self.file_id is None:
+            return await self._upload(sender, chat_id)
+        try:
+            return await sender(chat_id, self.file_id, caption=self.text, caption_entities=self.entities,
+                                reply_markup=self.reply_markup)
+        except BadRequest as e:
+            if not self.path or not _is_stale_file_id(e):
+                raise
+            logger.warning("Cached file_id for %s was rejected (%s); uploading again.", self.path, e)
+            forget_file_id(_path_key(self.path))
+            self.file_id = None
+            return await self._upload(sender, chat_id)
@@ -0,0 +1,141 @@
+# utils/multilingual.py
+import time
+import asyncio
+import secrets
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import config
+from .broadcast_utils import BroadcastAborted, fan_out
+from .media_utils import BroadcastPayload
+from .segments import KINDS, segments
+from .translate_utils import detect_myanmar, translate_async
+
+logger = logging.getLogger("ChurchBot.multilingual")
+
+LANG_PREFIX = "lang:"
+# Languages recipients can choose; the first one is the fallback for recipients with no preference.
+LANGUAGES = [code.strip() for code in config.BROADCAST_LANGUAGES.split(",") if code.strip()]
+DEFAULT_LANGUAGE = config.BROADCAST_DEFAULT_LANGUAGE.strip() or (LANGUAGES[0] if LANGUAGES else "en")
+# Unapproved drafts are discarded after this many seconds.
+DRAFT_TTL = config.BROADCAST_DRAFT_TTL
+
+
+def set_language(kind: str, chat_id, language: Optional[str]) -> bool:
+    """Store a recipient's preferred language (None clears it)."""
+    return segments.set_prefixed(kind, chat_id, LANG_PREFIX, language)
+
+
+def language_of(kind: str, chat_id) -> Optional[str]:
+    for tag in segments.tags_of(kind, chat_id):
+        if tag.startswith(LANG_PREFIX):
+            return tag[len(LANG_PREFIX):]
+    return None
+
+
+def source_language(payload: BroadcastPayload) -> str:
+    text = " ".join(payload.texts())
+    if detect_myanmar(text):
+        return "my"
+    return "en" if text.strip() else DEFAULT_LANGUAGE
+
+
+class LanguageDraft:
+    """
+    A broadcast split into one payload variant per recipient language,
+    waiting for admin approval. Each language is translated once.
+    """
+
+    def __init__(self, payload: BroadcastPayload, query: str, admin_id: int):
+        self.id = secrets.token_hex(4)
+        self.payload = payload
+        self.query = query
+        self.admin_id = admin_id
+        self.source = source_language(payload)
+        self.variants: Dict[str, BroadcastPayload] = {}
+        self.counts: Dict[str, Tuple[int, int]] = {}
+        self.opted_out = 0
+        # language -> error, for variants every recipient rejected
+        self.aborted: Dict[str, str] = {}
+        self.created = time.time()
+
+    def buckets(self, bitmap: Optional[int] = None) -> Dict[str, int]:
+        # query() already leaves opted-out recipients out, including for "all".
+        if bitmap is None:
+            bitmap = segments.query(self.query)
+        return segments.partition(bitmap, LANG_PREFIX, LANGUAGES, DEFAULT_LANGUAGE)
+
+    async def _variant(self, language: str) -> BroadcastPayload:
+        texts = self.payload.texts()
+        todo = [i for i, text in enumerate(texts) if text.strip()]
+        if language == self.source or not todo:
+            return self.payload
+        results = await asyncio.gather(*(translate_async(texts[i], language) for i in todo))
+        for i, translated in zip(todo, results):
+            texts[i] = translated
+        return self.payload.with_texts(texts)
+
+    async def prepare(self) -> None:
+        """Resolve language buckets and translate, concurrently, once per language present."""
+        bitmap, opted_out = segments.query_with_opted_out(self.query)
+        buckets = self.buckets(bitmap)
+        self.counts = {language: segments.count_bits(bits) for language, bits in buckets.items()}
+        self.opted_out = sum(segments.count_bits(opted_out))
+        languages = list(buckets)
+        variants = await asyncio.gather(*(self._variant(language) for language in languages))
+        self.variants = dict(zip(languages, variants))
+
+    def preview(self) -> List[str]:
+        lines = [f"🌐 Audience: {self.query} (source language: {self.source})"]
+        for language, (groups, users) in self.counts.items():
+            lines.append(f"[{language}] 👥 {groups} groups, 👤 {users} users")
+        if self.opted_out:
+            lines.append(f"🔕 {self.opted_out} opted-out recipients excluded")
+        variants = []
+        for language, variant in self.variants.items():
+            text = "\n".join(t for t in variant.texts() if t) or f"({variant.kind} without caption)"
+            variants.append(f"[{language}]\n{text}")
+        return ["\n".join(lines)] + variants
+
+    async def send(self, bot) -> Tuple[int, int]:
+        """
+        Fan each variant out to its bucket, re-resolving the audience at send
+        time. A variant every recipient rejects is skipped (see `aborted`).
+        """
+        success = fail = 0
+        for language, bits in self.buckets().items():
+            variant = self.variants.get(language)
+            if variant is None:  # recipient chose a language after the preview
+                variant = self.variants[language] = await self._variant(language)
+            streams = segments.ids(bits)
+            try:
+                for kind in KINDS:
+                    ok, failed = await fan_out(kind, streams[kind], lambda chat_id, v=variant: v.send(bot, chat_id))
+                    success += ok
+                    fail += failed
+            except BroadcastAborted as e:
+                self.aborted[language] = str(e)
+                logger.warning("Language broadcast %s: [%s] variant aborted: %s", self.id, language, e)
+                continue
+            logger.info("Language broadcast %s: sent [%s] variant.", self.id, language)
+        return success, fail
+
+
+_drafts: "OrderedDict[str, LanguageDraft]" = OrderedDict()
+
+
+def _expire_drafts() -> None:
+    cutoff = time.time() - DRAFT_TTL
+    while _drafts and next(iter(_drafts.values())).created < cutoff:
+        _drafts.popitem(last=False)
+
+
+def add_draft(draft: LanguageDraft) -> None:
+    _expire_drafts()
+    _drafts[draft.id] = draft
+
+
+def pop_draft(draft_id: str) -> Optional[LanguageDraft]:
+    _expire_drafts()
+    return _drafts.pop(draft_id, None)
@@ -0,0 +1,272 @@
+# utils/persistence.py
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import config
+from .json_utils import dumps, loads
+
+logger = logging.getLogger("ChurchBot.persistence")
+
+DB_URL = config.DB_URL
+# Quiz sessions untouched for this long are treated as abandoned.
+SESSION_TTL = config.QUIZ_SESSION_TTL
+# How long dirty entries are coalesced before one batched write.
+WRITE_DELAY = config.PERSISTENCE_WRITE_DELAY
+CACHE_SIZE = config.PERSISTENCE_CACHE_SIZE
+UPDATE_INTERVAL = config.PERSISTENCE_UPDATE_INTERVAL
+
+# user_data keys stored in dedicated columns; anything else goes to `extra`.
+QUIZ_KEYS = ("quiz_index", "score", "quiz_updated")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY,
+    quiz_index INTEGER,
+    score INTEGER,
+    updated REAL NOT NULL,
+    extra BLOB
+);
+CREATE INDEX IF NOT EXISTS user_state_updated ON user_state(updated);
+CREATE TABLE IF NOT EXISTS chat_state (
+    chat_id INTEGER PRIMARY KEY,
+    updated REAL NOT NULL,
+    data BLOB
+);
+"""
+
+
+def sqlite_path(db_url: str = DB_URL) -> str:
+    prefix = "sqlite:///"
+    if not db_url.startswith(prefix):
+        raise ValueError(f"Only sqlite URLs are supported, got {db_url!r}")
+    return db_url[len(prefix):]
+
+
+def _user_row(data: dict) -> Optional[Tuple]:
+    """Encode user_data as (quiz_index, score, updated, extra); None when empty."""
+    extra = {k: v for k, v in data.items() if k not in QUIZ_KEYS}
+    if data.get("quiz_index") is None and not extra:
+        return None
+    return (
+        data.get("quiz_index"),
+        data.get("score"),
+        data.get("quiz_updated") or 0.0,
+        dumps(extra) if extra else None,
+    )
+
+
+def _user_data(row) -> dict:
+    quiz_index, score, updated, extra = row
+    data = loads(extra) if extra else {}
+    if quiz_index is not None:
+        data.update({"quiz_index": quiz_index, "score": score or 0, "quiz_updated": updated})
+    return data
+
+
+def expire_session(user_data: dict, now: Optional[float] = None) -> bool:
+    """Drop an abandoned quiz session from user_data. Returns True if one was dropped."""
+    now = now or time.time()
+    if "quiz_index" in user_data and now - user_data.get("quiz_updated", now) > SESSION_TTL:
+        for key in QUIZ_KEYS:
+            user_data.pop(key, None)
+        return True
+    return False
+
+
+class SessionPersistence(BasePersistence):
+    """
+    SQLite-backed persistence for user_data and chat_data.
+
+    Unlike PicklePersistence, nothing is loaded at startup: a user's row is
+    read on their first update (refresh_user_data). PTB hands over every
+    touched user each interval; rows equal to what is already stored are
+    skipped, and the rest are written together in one transaction. Quiz
+    state uses fixed columns, other keys go to a compact JSON blob. Bot
+    data, callback data and conversations are not persisted.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, update_interval: float = UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db_path = db_path or sqlite_path()
+        dirpath = os.path.dirname(self.db_path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        # Last row known to be on disk, per key (bounded; a miss only costs a redundant write).
+        self._stored: "OrderedDict[Tuple[str, int], object]" = OrderedDict()
+        self._dirty: Dict[Tuple[str, int], object] = {}
+        self._write_task: Optional[asyncio.Task] = None
+
+    # --- cache helpers ---
+    def _remember(self, key, row) -> None:
+        self._stored[key] = row
+        self._stored.move_to_end(key)
+        while len(self._stored) > CACHE_SIZE:
+            self._stored.popitem(last=False)
+
+    def _mark(self, key, row) -> None:
+        if key in self._stored and self._stored[key] == row and key not in self._dirty:
+            return
+        self._dirty[key] = row
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_soon())
+
+    async def _write_soon(self) -> None:
+        await asyncio.sleep(WRITE_DELAY)
+        await self._write_dirty()
+        # Entries marked while that batch was in the worker thread saw this
+        # task still running and scheduled nothing, so write them here.
+        while self._dirty:
+            await asyncio.sleep(WRITE_DELAY)
+            await self._write_dirty()
+
+    async def _write_dirty(self) -> None:
+        dirty, self._dirty = self._dirty, {}
+        if dirty:
+            await asyncio.to_thread(self._write_batch, dirty)
+            for key, row in dirty.items():
+                self._remember(key, row)
+
+    def _write_batch(self, dirty: Dict) -> None:
+        user_rows, user_drops, chat_rows, chat_drops = [], [], [], []
+        now = time.time()
+        for (kind, key_id), row in dirty.items():
+            if kind == "user":
+                if row is None:
+                    user_drops.append((key_id,))
+                else:
+                    user_rows.append((key_id,) + row)
+            elif row is None:
+                chat_drops.append((key_id,))
+            else:
+                chat_rows.append((key_id, now, row))
+        with self._db_lock, self._conn:
+            if user_rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO user_state (user_id, quiz_index, score, updated, extra) VALUES (?, ?, ?, ?, ?)",
+                    user_rows,
+                )
+            if user_drops:
+                self._conn.executemany("DELETE FROM user_state WHERE user_id = ?", user_drops)
+            if chat_rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chat_state (chat_id, updated, data) VALUES (?, ?, ?)", chat_rows
+                )
+            if chat_drops:
+                self._conn.executemany("DELETE FROM chat_state WHERE chat_id = ?", chat_drops)
+        logger.debug("Persisted %d user and %d chat entries.", len(user_rows) + len(user_drops),
+                     len(chat_rows) + len(chat_drops))
+
+    def _select(self, sql: str, key_id: int):
+        with self._db_lock:
+            return self._conn.execute(sql, (key_id,)).fetchone()
+
+    # --- lazy loading ---
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        key = ("user", user_id)
+        if key not in self._stored and key not in self._dirty:
+            row = self._select("SELECT quiz_index, score, updated, extra FROM user_state WHERE user_id = ?", user_id)
+            if row is not None and not user_data:
+                user_data.update(_user_data(row))
+            self._remember(key, _user_row(user_data))
+        expire_session(user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        key = ("chat", chat_id)
+        if key not in self._stored and key not in self._dirty:
+            row = self._select("SELECT data FROM chat_state WHERE chat_id = ?", chat_id)
+            if row is not None and row[0] and not chat_data:
+                chat_data.update(loads(row[0]))
+            self._remember(key, dumps(chat_data) if chat_data else None)
+
+    # --- dirty tracking ---
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark(("user", user_id), _user_row(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._mark(("chat", chat_id), dumps(data) if data else None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(("user", user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark(("chat", chat_id), None)
+
+    def _purge_rows(self, cutoff: float) -> int:
+        with self._db_lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM user_state WHERE updated < ? AND extra IS NULL", (cutoff,)
+            ).rowcount
+            self._conn.execute(
+                "UPDATE user_state SET quiz_index = NULL, score = NULL WHERE updated < ?", (cutoff,)
+            )
+        return deleted
+
+    async def purge_expired(self, now: Optional[float] = None) -> int:
+        """Delete abandoned quiz sessions (rows with no other state) from disk."""
+        cutoff = (now or time.time()) - SESSION_TTL
+        deleted = await asyncio.to_thread(self._purge_rows, cutoff)
+        # Back on the loop, where refresh_user_data and _remember also touch _stored.
+        for key in [k for k in self._stored if k[0] == "user"]:
+            self._stored.pop(key, None)
+        if deleted:
+            logger.info("Purged %d abandoned quiz sessions.", deleted)
+        return deleted
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            self._write_task.cancel()
+        # A batch already handed to a worker thread still holds _db_lock, so
+        # the final write below cannot overtake it.
+        await self._write_dirty()
+        with self._db_lock:
+            self._conn.commit()
+
+    # --- data this bot does not persist ---
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        return None
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        return None
+
+
+async def purge_sessions_job(context) -> None:
+    """Scheduler job: remove abandoned quiz sessions from the database."""
+    persistence = getattr(context.application, "persistence", None)
+    if isinstance(persistence, SessionPersistence):
+        await persistence.purge_expired()
@@ -0,0 +1,139 @@
+# utils/router.py
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger("ChurchBot.router")
+
+Callback = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[object]]
+
+# Callback data without a namespace predates namespacing; those buttons are quiz answers.
+LEGACY_NAMESPACE = "quiz"
+
+_last_parsed: Tuple[Optional[Update], Optional[tuple]] = (None, None)
+
+
+def parse_command(update: Update) -> Optional[Tuple[str, Optional[str], List[str]]]:
+    """
+    (command, target bot username or None, args) for a /command message,
+    else None. The result for the update being processed is cached, so flood
+    control, analytics and the router share a single parse.
+    """
+    global _last_parsed
+    if _last_parsed[0] is update:
+        return _last_parsed[1]
+    parsed = None
+    message = update.effective_message
+    text = getattr(message, "text", None) if message else None
+    if text and text.startswith("/"):
+        words = text.split()
+        name, _, bot = words[0][1:].partition("@")
+        parsed = (name.lower(), bot or None, words[1:])
+    _last_parsed = (update, parsed)
+    return parsed
+
+
+def callback_namespace(update: Update) -> Optional[str]:
+    """Namespace of a callback query's data ("quiz" for "quiz:C" and for legacy bare "C"), else None."""
+    query = update.callback_query
+    if query is None:
+        return None
+    data = query.data if isinstance(query.data, str) else ""
+    namespace, sep, _ = data.partition(":")
+    return namespace if sep else LEGACY_NAMESPACE
+
+
+class Route:
+    __slots__ = ("callback", "feature")
+
+    def __init__(self, callback: Callback, feature: Optional[str]):
+        self.callback = callback
+        self.feature = feature
+
+
+class CommandRouter:
+    """
+    One handler for every command and one for every callback query, in
+    place of a CommandHandler per command that PTB would test in turn.
+    Commands are looked up by name and callback queries by the namespace
+    before the first ':' in their data. A route may belong to a feature
+    (quiz, broadcast, translation) that can be switched off at runtime.
+    """
+
+    def __init__(self):
+        self.commands: Dict[str, Route] = {}
+        self.callbacks: Dict[str, Route] = {}
+        self.features: Dict[str, bool] = {}
+        self.disabled_commands = set()
+
+    # --- registration ---
+    def add_command(self, name: str, callback: Callback, feature: Optional[str] = None) -> None:
+        name = name.lower()
+        if name in self.commands:
+            raise ValueError(f"/{name} is already routed")
+        self.commands[name] = Route(callback, feature)
+        if feature is not None:
+            self.features.setdefault(feature, True)
+
+    def add_callback(self, namespace: str, callback: Callback, feature: Optional[str] = None) -> None:
+        if namespace in self.callbacks:
+            raise ValueError(f"Callback namespace {namespace!r} is already routed")
+        self.callbacks[namespace] = Route(callback, feature)
+        if feature is not None:
+            self.features.setdefault(feature, True)
+
+    # --- runtime switches ---
+    def set_enabled(self, name: str, enabled: bool) -> bool:
+        """Switch a feature or a single command on/off. False if the name is unknown."""
+        name = name.lower().lstrip("/")
+        if name in self.features:
+            self.features[name] = enabled
+        elif name in self.commands:
+            if enabled:
+                self.disabled_commands.discard(name)
+            else:
+                self.disabled_commands.add(name)
+        else:
+            return False
+        logger.info("%s %s.", name, "enabled" if enabled else "disabled")
+        return True
+
+    def _enabled(self, route: Route) -> bool:
+        return route.feature is None or self.features.get(route.feature, True)
+
+    def is_enabled(self, command: str) -> bool:
+        route = self.commands.get(command)
+        return route is not None and command not in self.disabled_commands and self._enabled(route)
+
+    # --- dispatch ---
+    async def dispatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        parsed = parse_command(update)
+        if parsed is None:
+            return
+        name, bot, args = parsed
+        if bot is not None and bot.lower() != (context.bot.username or "").lower():
+            return  # addressed to another bot in the same group
+        route = self.commands.get(name)
+        if route is None:
+            return
+        if name in self.disabled_commands or not self._enabled(route):
+            await update.effective_message.reply_text(f"⏸️ /{name} is currently disabled.")
+            return
+        context.args = args
+        await route.callback(update, context)
+
+    async def dispatch_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        route = self.callbacks.get(callback_namespace(update))
+        if route is None:
+            await query.answer()
+            return
+        if not self._enabled(route):
+            await query.answer("⏸️ This feature is currently disabled.", show_alert=True)
+            return
+        await route.callback(update, context)
+
+
+router = CommandRouter()
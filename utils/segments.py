@@ -0,0 +1,429 @@
+# utils/segments.py
+import os
+import re
+import zlib
+import base64
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .json_utils import load_json, update_json
+from .bot_utils import GROUPS_FILE, USERS_FILE
+
+logger = logging.getLogger("ChurchBot.segments")
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SEGMENTS_FILE = os.path.join(DATA_DIR, "segments.json")
+
+KINDS = ("group", "user")
+# Recipients with this tag (set by /optout) are left out of every query result.
+OPT_OUT_TAG = "opted_out"
+TAG_RE = re.compile(r"^[a-z0-9_:\-]{1,40}$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+# --- Bitmaps ---
+# A bitmap is a Python int: bit i set <=> recipient i has the tag. Boolean
+# queries are single big-int AND/OR/AND-NOT operations, which run in a few
+# microseconds over 100k recipients (12.5 KB per bitmap). On disk each
+# bitmap is zlib-compressed, which collapses sparse and dense runs alike.
+
+def encode_bitmap(bitmap: int) -> str:
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    return base64.b64encode(zlib.compress(raw)).decode("ascii")
+
+
+def decode_bitmap(data: str) -> int:
+    return int.from_bytes(zlib.decompress(base64.b64decode(data)), "little")
+
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Yield set bit positions in ascending order, skipping empty bytes."""
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(raw):
+        while byte:
+            low = byte & -byte
+            yield byte_index * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+# --- Query parsing: NOT > AND > OR, parentheses, case-insensitive ---
+
+_TOKEN_RE = re.compile(r"\(|\)|[^\s()]+")
+
+
+def _tokenize(query: str) -> List[str]:
+    return [t.lower() for t in _TOKEN_RE.findall(query)]
+
+
+class _Parser:
+    def __init__(self, tokens: List[str], resolve, universe: int):
+        self.tokens = tokens
+        self.pos = 0
+        self.resolve = resolve
+        self.universe = universe
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise QueryError("Unexpected end of query")
+        self.pos += 1
+        return token
+
+    def parse(self) -> int:
+        value = self.expr()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected '{self.peek()}'")
+        return value
+
+    def expr(self) -> int:
+        value = self.term()
+        while self.peek() == "or":
+            self.take()
+            value |= self.term()
+        return value
+
+    def term(self) -> int:
+        value = self.factor()
+        while self.peek() == "and":
+            self.take()
+            value &= self.factor()
+        return value
+
+    def factor(self) -> int:
+        token = self.take()
+        if token == "not":
+            return self.universe & ~self.factor()
+        if token == "(":
+            value = self.expr()
+            if self.take() != ")":
+                raise QueryError("Missing ')'")
+            return value
+        if token in ("and", "or", ")"):
+            raise QueryError(f"Unexpected '{token}'")
+        if token in ("all", "*"):
+            return self.universe
+        return self.resolve(token)
+
+
+class SegmentIndex:
+    """
+    Tag -> bitmap index over groups and users.
+
+    Every recipient gets a stable dense position ("group:<id>"/"user:<id>")
+    the first time it is tagged or seen in groups.json/users.json. Queries
+    are intersected with the current recipient universe, so pruned chats
+    drop out without rewriting any bitmap. Positions are never reused, so
+    the universe stays valid when the index is reloaded.
+
+    The bot's own writes to groups.json/users.json report each change with
+    member_added()/member_removed(), which flips a single universe bit. Any
+    other change (another instance, datatool, a hand edit) shows up as a
+    new file stat and triggers one rebuild on the next query.
+    """
+
+    def __init__(self, path: str = SEGMENTS_FILE):
+        self.path = path
+        self.recipients: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+        self._mtime = None
+        self._universe: Dict[str, int] = {kind: 0 for kind in KINDS}
+        # File stats per kind the universe reflects; None until the first build.
+        self._universe_stats: Optional[Dict[str, tuple]] = None
+        # New members without a position yet; placed together on the next query.
+        self._unplaced: Dict[str, str] = {}
+
+    # --- storage ---
+    def _reload(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime:
+            return
+        data = load_json(self.path, {}) or {}
+        self._adopt(data)
+        self._mtime = mtime
+
+    def _adopt(self, data: Dict) -> None:
+        recipients = list(data.get("recipients", []))
+        known = len(self.recipients)
+        if known and len(recipients) >= known and recipients[known - 1] == self.recipients[-1]:
+            # Positions are append-only: index just the recipients added since.
+            for i in range(known, len(recipients)):
+                self.positions[recipients[i]] = i
+        else:
+            self.positions = {key: i for i, key in enumerate(recipients)}
+        self.recipients = recipients
+        self.tags = {tag: decode_bitmap(value) for tag, value in data.get("tags", {}).items()}
+
+    def _mutate(self, change) -> bool:
+        """Re-read the index under the file lock, apply change() and write it back if it returns True."""
+        result = {}
+
+        def mutate(data) -> bool:
+            self._adopt(data)
+            changed = change()
+            if changed:
+                data["recipients"] = self.recipients
+                data["tags"] = {tag: encode_bitmap(bits) for tag, bits in self.tags.items() if bits}
+            result["changed"] = changed
+            return changed
+
+        update_json(self.path, mutate, {})
+        try:
+            self._mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self._mtime = None
+        return result.get("changed", False)
+
+    def _position(self, key: str) -> int:
+        position = self.positions.get(key)
+        if position is None:
+            position = len(self.recipients)
+            self.recipients.append(key)
+            self.positions[key] = position
+        return position
+
+    # --- tagging ---
+    def tag(self, kind: str, chat_id, tags: List[str]) -> List[str]:
+        """Add tags to a recipient; returns the tags that were newly set."""
+        added = []
+
+        def change() -> bool:
+            bit = 1 << self._position(f"{kind}:{chat_id}")
+            for tag in tags:
+                if not self.tags.get(tag, 0) & bit:
+                    self.tags[tag] = self.tags.get(tag, 0) | bit
+                    added.append(tag)
+            return bool(added)
+
+        self._mutate(change)
+        return added
+
+    def untag(self, kind: str, chat_id, tags: List[str]) -> List[str]:
+        removed = []
+
+        def change() -> bool:
+            position = self.positions.get(f"{kind}:{chat_id}")
+            if position is None:
+                return False
+            bit = 1 << position
+            for tag in tags:
+                if self.tags.get(tag, 0) & bit:
+                    self.tags[tag] &= ~bit
+                    removed.append(tag)
+            return bool(removed)
+
+        self._mutate(change)
+        return removed
+
+    def set_prefixed(self, kind: str, chat_id, prefix: str, value: Optional[str]) -> bool:
+        """Replace the recipient's `<prefix><x>` tag (e.g. lang:my) with prefix+value, or clear it."""
+
+        def change() -> bool:
+            if value is None and f"{kind}:{chat_id}" not in self.positions:
+                return False
+            bit = 1 << self._position(f"{kind}:{chat_id}")
+            target = prefix + value if value is not None else None
+            changed = False
+            for tag, bits in list(self.tags.items()):
+                if tag.startswith(prefix) and tag != target and bits & bit:
+                    self.tags[tag] = bits & ~bit
+                    changed = True
+            if target is not None and not self.tags.get(target, 0) & bit:
+                self.tags[target] = self.tags.get(target, 0) | bit
+                changed = True
+            return changed
+
+        return self._mutate(change)
+
+    def migrate(self, kind: str, old_id, new_id) -> bool:
+        """Carry a recipient's tags over to its new ID (group -> supergroup)."""
+
+        def change() -> bool:
+            old = self.positions.get(f"{kind}:{old_id}")
+            if old is None:
+                return False
+            old_bit, new_bit = 1 << old, 1 << self._position(f"{kind}:{new_id}")
+            for tag, bits in self.tags.items():
+                if bits & old_bit:
+                    self.tags[tag] = (bits & ~old_bit) | new_bit
+            return True
+
+        return self._mutate(change)
+
+    def tags_of(self, kind: str, chat_id) -> List[str]:
+        self._reload()
+        position = self.positions.get(f"{kind}:{chat_id}")
+        if position is None:
+            return []
+        bit = 1 << position
+        return sorted(tag for tag, bits in self.tags.items() if bits & bit)
+
+    # --- universe ---
+    @staticmethod
+    def _list_stats() -> Dict[str, Optional[tuple]]:
+        stats = {}
+        for kind, path in (("group", GROUPS_FILE), ("user", USERS_FILE)):
+            try:
+                st = os.stat(path)
+                stats[kind] = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except FileNotFoundError:
+                stats[kind] = None
+        return stats
+
+    def member_added(self, kind: str, chat_id) -> None:
+        """Record a recipient the bot just added to groups.json/users.json."""
+        self._note_member(kind, str(chat_id), True)
+
+    def member_removed(self, kind: str, chat_id) -> None:
+        """Record a recipient the bot just removed from groups.json/users.json."""
+        self._note_member(kind, str(chat_id), False)
+
+    def _note_member(self, kind: str, chat_id: str, present: bool) -> None:
+        if self._universe_stats is None:
+            return  # not built yet; the first query reads the lists
+        key = f"{kind}:{chat_id}"
+        position = self.positions.get(key)
+        if position is None:
+            if present:
+                self._unplaced[key] = kind
+            else:
+                self._unplaced.pop(key, None)
+        elif present:
+            self._universe[kind] |= 1 << position
+        else:
+            self._universe[kind] &= ~(1 << position)
+        self._universe_stats[kind] = self._list_stats()[kind]
+
+    def _place_unplaced(self) -> None:
+        """Give queued new members positions (one index write) and add them to the universe."""
+        unplaced, self._unplaced = self._unplaced, {}
+
+        def assign() -> bool:
+            before = len(self.recipients)
+            for key in unplaced:
+                self._position(key)
+            return len(self.recipients) != before
+
+        self._mutate(assign)
+        for key, kind in unplaced.items():
+            self._universe[kind] |= 1 << self.positions[key]
+
+    def _rebuild_universe(self, stats: Dict[str, Optional[tuple]]) -> None:
+        lists = {"group": load_json(GROUPS_FILE, []), "user": load_json(USERS_FILE, [])}
+        missing = [f"{kind}:{chat_id}" for kind, ids in lists.items() for chat_id in ids
+                   if f"{kind}:{chat_id}" not in self.positions]
+        if missing:
+            # Give new recipients positions so NOT queries can include them.
+            def assign() -> bool:
+                for recipient in missing:
+                    self._position(recipient)
+                return True
+
+            self._mutate(assign)
+        for kind, ids in lists.items():
+            # Set bits in a byte buffer: OR-ing 1 << position into a big int
+            # copies the whole int each time, quadratic over 100k recipients.
+            raw = bytearray((len(self.recipients) + 7) // 8)
+            for chat_id in ids:
+                position = self.positions[f"{kind}:{chat_id}"]
+                raw[position >> 3] |= 1 << (position & 7)
+            self._universe[kind] = int.from_bytes(raw, "little")
+        self._unplaced = {}
+        self._universe_stats = stats
+
+    def _universe_bitmaps(self) -> Dict[str, int]:
+        """Bitmap of current recipients per kind."""
+        stats = self._list_stats()
+        if stats != self._universe_stats:
+            self._rebuild_universe(stats)
+        elif self._unplaced:
+            self._place_unplaced()
+        return self._universe
+
+    # --- queries ---
+    def query(self, expression: str) -> int:
+        """
+        Evaluate e.g. "youth AND yangon" to a recipient bitmap. Opted-out
+        recipients are never part of the result, whatever the expression.
+        """
+        return self.query_with_opted_out(expression)[0]
+
+    def query_with_opted_out(self, expression: str) -> Tuple[int, int]:
+        """(query(expression), the opted-out recipients the expression matched but query() leaves out)."""
+        self._reload()
+        tokens = _tokenize(expression)
+        if not tokens:
+            raise QueryError("Empty audience query")
+        universe = self._universe_bitmaps()
+        everyone = universe["group"] | universe["user"]
+
+        def resolve(tag: str) -> int:
+            # "groups"/"users" are built-in segments for the recipient kind.
+            if tag in ("groups", "users"):
+                return universe[tag[:-1]]
+            return self.tags.get(tag, 0)
+
+        matched = _Parser(tokens, resolve, everyone).parse() & everyone
+        opted_out = matched & self.tags.get(OPT_OUT_TAG, 0)
+        return matched & ~opted_out, opted_out
+
+    def partition(self, bitmap: int, prefix: str, values: List[str], default: str) -> Dict[str, int]:
+        """
+        Split a result bitmap by `<prefix><value>` tags; recipients with none
+        of them land in `default`. A recipient is counted once, under the
+        first matching value.
+        """
+        buckets = {}
+        rest = bitmap
+        for value in values:
+            bits = rest & self.tags.get(prefix + value, 0)
+            if bits:
+                buckets[value] = bits
+                rest &= ~bits
+        if rest:
+            buckets[default] = buckets.get(default, 0) | rest
+        return buckets
+
+    def audience(self, expression: str) -> Dict[str, Iterator[str]]:
+        """Resolve a query into per-kind ID generators, ready for fan_out."""
+        return self.ids(self.query(expression))
+
+    def ids(self, bitmap: int) -> Dict[str, Iterator[str]]:
+        """Per-kind ID generators over a bitmap returned by query(); opted-out recipients are skipped."""
+        universe = dict(self._universe)  # later member changes must not shift a running stream
+        recipients = self.recipients
+        bitmap &= ~self.tags.get(OPT_OUT_TAG, 0)
+
+        def stream(kind: str) -> Iterator[str]:
+            for position in iter_bits(bitmap & universe[kind]):
+                yield recipients[position].split(":", 1)[1]
+
+        return {kind: stream(kind) for kind in KINDS}
+
+    def count(self, expression: str) -> Tuple[int, int]:
+        return self.count_bits(self.query(expression))
+
+    def count_bits(self, bitmap: int) -> Tuple[int, int]:
+        return bin(bitmap & self._universe["group"]).count("1"), bin(bitmap & self._universe["user"]).count("1")
+
+    def tag_counts(self) -> Dict[str, int]:
+        self._reload()
+        universe = self._universe_bitmaps()
+        everyone = universe["group"] | universe["user"]
+        return {tag: bin(bits & everyone).count("1") for tag, bits in sorted(self.tags.items())}
+
+
+def valid_tag(tag: str) -> bool:
+    return bool(TAG_RE.match(tag))
+
+
+segments = SegmentIndex()
@@ -1,9 +1,22 @@
 # utils/translate_utils.py
 from deep_translator import GoogleTranslator
+import os
+import asyncio
+import hashlib
 import logging
 
+import config
+from .json_utils import load_json, update_json
+
 logger = logging.getLogger(__name__)
 
+DATA_DIR = os.getenv("DATA_DIR", "data")
+TRANSLATION_CACHE_FILE = os.path.join(DATA_DIR, "translations.json")
+TRANSLATION_CACHE_SIZE = config.TRANSLATION_CACHE_SIZE
+
+_cache = None
+_inflight = {}
+
 def detect_myanmar(text: str) -> bool:
     # simple heuristic: contains Myanmar Unicode block
     return any("\u1000" <= ch <= "\u109F" for ch in text)
@@ -23,3 +36,45 @@ def translate_auto(text: str, target: str = None) -> str:
     except Exception as e:
         logger.exception("Translation failed: %s", e)
         raise
+
+def _cache_key(text: str, target: str) -> str:
+    return f"{target}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+def translate_cached(text: str, target: str) -> str:
+    """
+    translate_auto with a persistent cache (translations.json), so the same
+    text is sent to the translator once per target language.
+    """
+    global _cache
+    if _cache is None:
+        _cache = load_json(TRANSLATION_CACHE_FILE, {}) or {}
+    key = _cache_key(text, target)
+    if key in _cache:
+        return _cache[key]
+    translated = translate_auto(text, target)
+    _cache[key] = translated
+
+    def store(cache) -> bool:
+        cache.pop(key, None)
+        cache[key] = translated  # newest last; oldest entries are trimmed first
+        for old in list(cache)[:max(0, len(cache) - TRANSLATION_CACHE_SIZE)]:
+            del cache[old]
+        return True
+
+    update_json(TRANSLATION_CACHE_FILE, store, {})
+    if len(_cache) > TRANSLATION_CACHE_SIZE:
+        _cache = load_json(TRANSLATION_CACHE_FILE, {}) or {}
+    return translated
+
+async def translate_async(text: str, target: str) -> str:
+    """
+    translate_cached in a worker thread. Concurrent requests for the same
+    text and target share one translation call.
+    """
+    key = _cache_key(text, target)
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(asyncio.to_thread(translate_cached, text, target))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await future